@@ -1,10 +1,15 @@
 import os
-from typing import Dict, Any, List, Optional
+import re
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+import httpx
 from dotenv import load_dotenv
-from langchain_core.prompts import PromptTemplate
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableSequence
 from langchain_openai import ChatOpenAI
-from app.utils.logging_utils import setup_logger
+from app.utils.logging_utils import setup_logger, LazyRepr
 
 # Set up logger
 logger = setup_logger("base_agent")
@@ -18,16 +23,68 @@ if not OPENAI_API_KEY:
     logger.error("OpenAI API key not found in environment variables")
     raise ValueError("OpenAI API key not found")
 
+# Shared HTTP client so all agents reuse one connection pool and keep-alive sessions
+shared_httpx_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    http2=True
+)
+
+# One LLM client per (model, temperature) shared across agent instances
+_LLM_REGISTRY: Dict[Tuple[str, float], ChatOpenAI] = {}
+
+def get_llm(model_name: str, temperature: float) -> ChatOpenAI:
+    """Return the shared LLM client for a model and temperature, creating it on first use."""
+    key = (model_name, temperature)
+    if key not in _LLM_REGISTRY:
+        _LLM_REGISTRY[key] = ChatOpenAI(
+            model=model_name,
+            temperature=temperature,
+            openai_api_key=OPENAI_API_KEY,
+            http_async_client=shared_httpx_client
+        )
+    return _LLM_REGISTRY[key]
+
+# Parsed prompt templates keyed by (system prompt, template text, input variables)
+_TEMPLATE_CACHE: Dict[Tuple[str, str, Tuple[str, ...]], ChatPromptTemplate] = {}
+
+def get_prompt_template(system_prompt: str, template: str, input_variables: List[str]) -> ChatPromptTemplate:
+    """
+    Return the cached prompt template for a system prompt and template string,
+    creating it on first use.
+    
+    The system prompt is sent as its own leading system message so every call
+    from an agent shares the same static prefix, which lets the provider reuse
+    its prompt cache instead of reprocessing the system prompt each time.
+    """
+    key = (system_prompt, template, tuple(input_variables))
+    if key not in _TEMPLATE_CACHE:
+        _TEMPLATE_CACHE[key] = ChatPromptTemplate.from_messages([
+            SystemMessage(content=system_prompt),
+            ("human", template)
+        ])
+    return _TEMPLATE_CACHE[key]
+
+# Maximum number of responses kept in the exact-match prompt cache
+EXACT_CACHE_MAX_SIZE = 1024
+
+# Upper bound on the length of a section header matched by stream_sections,
+# so each chunk only needs to be searched together with this much earlier text
+MAX_SECTION_HEADER_LEN = 64
+
 class BaseAgent:
     """Base class for all agents in the system."""
     
+    # Process-wide cache of LLM responses keyed by rendered prompt, model and temperature
+    _exact_cache: "OrderedDict[str, str]" = OrderedDict()
+    
     def __init__(
         self,
         name: str,
         system_prompt: str,
         model_name: str = "gpt-4o",
         temperature: float = 0.7,
-        tools: Optional[List[Any]] = None
+        tools: Optional[List[Any]] = None,
+        cacheable: bool = False
     ):
         """
         Initialize the base agent.
@@ -38,84 +95,103 @@ class BaseAgent:
             model_name: LLM model name to use
             temperature: Temperature for the LLM
             tools: List of tools available to the agent
+            cacheable: Whether responses may be reused for identical prompts
+                even when the temperature is above zero
         """
         self.name = name
         self.system_prompt = system_prompt
         self.model_name = model_name
         self.temperature = temperature
         self.tools = tools or []
+        self.cacheable = cacheable or temperature == 0
         
-        logger.info(f"Initializing {name} with model {model_name}")
+        logger.info("Initializing %s with model %s", name, model_name)
         
         try:
-            # Initialize the LLM
-            self.llm = ChatOpenAI(
-                model=model_name,
-                temperature=temperature,
-                openai_api_key=OPENAI_API_KEY
-            )
-            logger.debug(f"LLM initialized with temperature {temperature}")
+            # Get the shared LLM client
+            self.llm = get_llm(model_name, temperature)
+            logger.debug("LLM initialized with temperature %s", temperature)
             
             # Initialize with default prompt template
-            self.prompt_template = PromptTemplate(
-                input_variables=["input", "context"],
-                template=f"{system_prompt}\n\nInput: {{input}}\nContext: {{context}}"
+            self.prompt_template = get_prompt_template(
+                system_prompt=system_prompt,
+                template="Input: {input}\nContext: {context}",
+                input_variables=["input", "context"]
             )
             logger.debug("Default prompt template initialized")
             
             # Create a runnable sequence
             self.chain = self.prompt_template | self.llm
-            logger.info(f"{name} initialization completed")
+            logger.info("%s initialization completed", name)
             
         except Exception as e:
-            logger.error(f"Error initializing {name}: {str(e)}", exc_info=True)
+            logger.error("Error initializing %s: %s", name, e, exc_info=True)
             raise
     
     def set_prompt_template(self, template: str, input_variables: List[str]):
         """
-        Set a custom prompt template.
+        Set a custom prompt template. The agent's system prompt is sent
+        separately as a system message, so it should not appear in the template.
         
         Args:
             template: The prompt template string
             input_variables: List of input variable names
         """
         try:
-            logger.debug(f"Setting custom prompt template for {self.name}")
-            logger.debug(f"Input variables: {input_variables}")
+            logger.debug("Setting custom prompt template for %s", self.name)
+            logger.debug("Input variables: %s", input_variables)
             
-            self.prompt_template = PromptTemplate(
-                input_variables=input_variables,
-                template=template
-            )
+            self.prompt_template = get_prompt_template(self.system_prompt, template, input_variables)
             self.chain = self.prompt_template | self.llm
             logger.info("Custom prompt template set successfully")
             
         except Exception as e:
-            logger.error(f"Error setting prompt template: {str(e)}", exc_info=True)
+            logger.error("Error setting prompt template: %s", e, exc_info=True)
             raise
     
-    async def run(self, inputs: Dict[str, Any], context: str = "") -> str:
+    async def run(
+        self,
+        inputs: Dict[str, Any],
+        context: str = "",
+        prompt_template: Optional[ChatPromptTemplate] = None,
+        response_format: Optional[Dict[str, Any]] = None
+    ) -> str:
         """
         Run the agent with the given inputs.
         
         Args:
             inputs: Dictionary of inputs to the agent
             context: Additional context for the agent
+            prompt_template: Prompt to use instead of the agent's own, e.g. one
+                built with get_prompt_template for a secondary task
+            response_format: OpenAI response format to request, e.g. JSON mode
             
         Returns:
             The agent's response
         """
         try:
-            logger.info(f"Running {self.name}")
-            logger.debug(f"Input keys: {list(inputs.keys())}")
+            logger.info("Running %s", self.name)
+            logger.debug("Input keys: %s", LazyRepr(lambda: list(inputs.keys())))
             
             # Add context to inputs
             inputs["context"] = context
             
+            # Return the cached response for an identical prompt if allowed
+            cache_key = self._exact_cache_key(inputs, prompt_template, response_format)
+            cached = self._exact_cache_get(cache_key)
+            if cached is not None:
+                logger.info("%s returned cached response", self.name)
+                return cached
+            
+            chain = self.chain
+            if prompt_template is not None or response_format is not None:
+                llm = self.llm.bind(response_format=response_format) if response_format else self.llm
+                chain = (prompt_template or self.prompt_template) | llm
+            
             # Run the chain
             logger.debug("Invoking LLM chain")
-            result = await self.chain.ainvoke(inputs)
-            logger.debug(f"Received response from LLM: {type(result)}")
+            result = await chain.ainvoke(inputs)
+            logger.debug("Received response from LLM: %s", type(result))
             
             # Extract the content from the response
             if hasattr(result, 'content'):
@@ -125,10 +201,126 @@ class BaseAgent:
                 logger.debug("Converting response to string")
                 content = str(result)
             
-            logger.debug(f"Response length: {len(content)}")
-            logger.info(f"{self.name} completed successfully")
+            logger.debug("Response length: %s", len(content))
+            
+            self._exact_cache_set(cache_key, content)
+            
+            logger.info("%s completed successfully", self.name)
             return content
             
         except Exception as e:
-            logger.error(f"Error running {self.name}: {str(e)}", exc_info=True)
-            raise 
\ No newline at end of file
+            logger.error("Error running %s: %s", self.name, e, exc_info=True)
+            raise
+    
+    async def stream(self, inputs: Dict[str, Any], context: str = "") -> AsyncIterator[str]:
+        """
+        Run the agent and yield the response text as it is generated.
+        
+        Args:
+            inputs: Dictionary of inputs to the agent
+            context: Additional context for the agent
+            
+        Yields:
+            Chunks of the agent's response
+        """
+        try:
+            logger.info("Streaming %s", self.name)
+            logger.debug("Input keys: %s", LazyRepr(lambda: list(inputs.keys())))
+            
+            # Add context to inputs
+            inputs["context"] = context
+            
+            # Replay the cached response for an identical prompt if allowed
+            cache_key = self._exact_cache_key(inputs)
+            cached = self._exact_cache_get(cache_key)
+            if cached is not None:
+                logger.info("%s returned cached response", self.name)
+                yield cached
+                return
+            
+            chunks = []
+            async for chunk in self.chain.astream(inputs):
+                text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                chunks.append(text)
+                yield text
+            
+            self._exact_cache_set(cache_key, "".join(chunks))
+            
+            logger.info("%s streaming completed successfully", self.name)
+            
+        except Exception as e:
+            logger.error("Error streaming %s: %s", self.name, e, exc_info=True)
+            raise
+    
+    async def stream_sections(
+        self,
+        inputs: Dict[str, Any],
+        header_re: "re.Pattern[str]",
+        context: str = ""
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Stream the agent's response and yield each headed section once it is complete.
+        
+        A section is complete as soon as the next header arrives, so callers can
+        process earlier sections while the rest of the response is generated.
+        
+        Args:
+            inputs: Dictionary of inputs to the agent
+            header_re: Pattern matching a section header, with the header name as group 1
+            context: Additional context for the agent
+            
+        Yields:
+            (header, text) pairs in the order they appear in the response
+        """
+        buffer = ""
+        header = None
+        search_from = 0
+        async for chunk in self.stream(inputs, context):
+            buffer += chunk
+            while True:
+                match = header_re.search(buffer, search_from)
+                # Wait for more text if the header may still be incomplete
+                if match is None or match.end() == len(buffer):
+                    # Only a header overlapping the next chunk can match later
+                    search_from = max(len(buffer) - MAX_SECTION_HEADER_LEN, 0)
+                    break
+                if header is not None:
+                    yield header, buffer[:match.start()].strip()
+                header = match.group(1)
+                buffer = buffer[match.end():]
+                search_from = 0
+        
+        if header is not None:
+            yield header, buffer.strip()
+    
+    def _exact_cache_key(
+        self,
+        inputs: Dict[str, Any],
+        prompt_template: Optional[ChatPromptTemplate] = None,
+        response_format: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """Return the exact-match cache key for the rendered prompt, or None if not cacheable."""
+        if not self.cacheable:
+            return None
+        rendered = (prompt_template or self.prompt_template).format(**inputs)
+        return hashlib.blake2b(
+            f"{self.model_name}|{self.temperature}|{response_format}|{rendered}".encode(),
+            digest_size=32
+        ).hexdigest()
+    
+    def _exact_cache_get(self, cache_key: Optional[str]) -> Optional[str]:
+        """Return the cached response for a key, marking it as recently used."""
+        if cache_key is None:
+            return None
+        cached = self._exact_cache.get(cache_key)
+        if cached is not None:
+            self._exact_cache.move_to_end(cache_key)
+        return cached
+    
+    def _exact_cache_set(self, cache_key: Optional[str], content: str) -> None:
+        """Store a response in the exact-match cache, evicting the oldest entry if full."""
+        if cache_key is None:
+            return
+        self._exact_cache[cache_key] = content
+        if len(self._exact_cache) > EXACT_CACHE_MAX_SIZE:
+            self._exact_cache.popitem(last=False)
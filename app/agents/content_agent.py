@@ -1,73 +1,160 @@
-from typing import Dict, Any, List
-from app.agents.base_agent import BaseAgent
+import asyncio
+import hashlib
+import json
+import re
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple, Union
+from openai import AsyncOpenAI
+from app.agents.base_agent import BaseAgent, OPENAI_API_KEY, shared_httpx_client
+from app.utils.semantic_cache import create_semantic_cache
+from app.utils.logging_utils import setup_logger
+
+# Set up logger
+logger = setup_logger("content_agent")
+
+# Patterns for splitting a lesson response into its content and resources sections
+_CONTENT_RE = re.compile(r"CONTENT:\s*(?P<content>.*?)\s*RESOURCES:\s*(?P<resources>.*)", re.DOTALL)
+_LINE_RE = re.compile(r"\n+")
+
+CONTENT_MARKER = "CONTENT:"
+RESOURCES_MARKER = "RESOURCES:"
+
+_CONTENT_SYSTEM_PROMPT = """
+You are a Content Agent responsible for creating detailed educational content for courses.
+Your task is to generate comprehensive, accurate, and engaging content for course lessons.
+
+Follow these guidelines:
+1. Create clear and concise explanations of concepts
+2. Use examples to illustrate complex ideas
+3. Include relevant case studies and real-world applications
+4. Write in an engaging and conversational style
+5. Ensure content is accurate and up-to-date
+6. Tailor the content to the target audience's background and learning needs
+7. Include relevant activities or exercises where appropriate
+"""
+
+_CONTENT_TEMPLATE = """
+You are creating content for a course titled: {course_title}
+
+Course Description: {course_description}
+
+You need to create content for:
+Module: {module_title}
+Lesson: {lesson_title}
+
+Additional context:
+- Target audience: {audience}
+- Course duration: {duration}
+
+Research information:
+{research_info}
+
+Based on this information, create comprehensive and engaging content for this lesson.
+The content should be educational, accurate, and tailored to the target audience.
+
+Return your content in the following format:
+
+CONTENT:
+[Your lesson content here, including explanations, examples, and any exercises]
+
+RESOURCES:
+[List 2-4 relevant resources for further learning]
+"""
+
+_CONTENT_INPUT_VARIABLES = [
+    "course_title", "course_description",
+    "module_title", "lesson_title", "audience", "duration",
+    "research_info"
+]
 
 class ContentAgent(BaseAgent):
     """Agent responsible for generating detailed content for each module and lesson."""
     
     def __init__(self, model_name: str = "gpt-4o", temperature: float = 0.5):
         """Initialize the content agent."""
-        system_prompt = """
-        You are a Content Agent responsible for creating detailed educational content for courses.
-        Your task is to generate comprehensive, accurate, and engaging content for course lessons.
-        
-        Follow these guidelines:
-        1. Create clear and concise explanations of concepts
-        2. Use examples to illustrate complex ideas
-        3. Include relevant case studies and real-world applications
-        4. Write in an engaging and conversational style
-        5. Ensure content is accurate and up-to-date
-        6. Tailor the content to the target audience's background and learning needs
-        7. Include relevant activities or exercises where appropriate
-        """
-        
         super().__init__(
             name="Content Agent",
-            system_prompt=system_prompt,
+            system_prompt=_CONTENT_SYSTEM_PROMPT,
             model_name=model_name,
             temperature=temperature
         )
         
         # Set a custom prompt template for the content creation task
-        content_template = """
-        {system_prompt}
-        
-        You are creating content for a course titled: {course_title}
-        
-        Course Description: {course_description}
+        self.set_prompt_template(
+            template=_CONTENT_TEMPLATE,
+            input_variables=_CONTENT_INPUT_VARIABLES
+        )
         
-        You need to create content for:
-        Module: {module_title}
-        Lesson: {lesson_title}
+        # Cache generated lessons so near-identical requests skip the LLM
+        self.semantic_cache = create_semantic_cache(
+            collection_name="course_gen_lessons",
+            model_name=model_name,
+            temperature=temperature,
+            threshold=0.9
+        )
+    
+    async def generate_lesson_content(
+        self,
+        course_title: str,
+        course_description: str,
+        module_title: str,
+        lesson_title: str,
+        research_data: Dict[str, Any],
+        audience: str = "",
+        duration: str = "",
+        research_info: Optional[str] = None,
+        key_vector: Optional[Any] = None,
+        cache_checked: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Generate content for a specific lesson.
         
-        Additional context:
-        - Target audience: {audience}
-        - Course duration: {duration}
+        Args:
+            course_title: The title of the course
+            course_description: The course description
+            module_title: The title of the module
+            lesson_title: The title of the lesson
+            research_data: Research data dictionary
+            audience: The target audience for the course
+            duration: The duration of the course
+            research_info: Research data already formatted with format_research_info,
+                to avoid reformatting it for every lesson
+            key_vector: Cache key embedding from lookup_cached_lessons, used to store
+                the result. None if the key could not be embedded
+            cache_checked: Whether lookup_cached_lessons already checked the cache,
+                so it is not looked up again even if embedding the key failed
+            
+        Returns:
+            Dictionary containing the lesson content and resources
+        """
+        if research_info is None:
+            research_info = self.format_research_info(research_data)
         
-        Research information:
-        {research_info}
+        # Check the semantic cache for a similar lesson before calling the LLM
+        scope = self._research_scope(research_info)
+        if not cache_checked:
+            key_vector, cached = await self._cache_lookup(
+                self._cache_key(course_title, module_title, lesson_title, audience), scope
+            )
+            if cached is not None:
+                logger.info("Semantic cache hit for lesson: %s", lesson_title)
+                return cached
         
-        Based on this information, create comprehensive and engaging content for this lesson.
-        The content should be educational, accurate, and tailored to the target audience.
+        inputs = self._build_inputs(
+            course_title, course_description, module_title, lesson_title,
+            research_info, audience, duration
+        )
         
-        Return your content in the following format:
+        result = await self.run(inputs)
         
-        CONTENT:
-        [Your lesson content here, including explanations, examples, and any exercises]
+        # Parse the result into a structured format off the event loop
+        content_data = await asyncio.to_thread(self._parse_content_result, result)
         
-        RESOURCES:
-        [List 2-4 relevant resources for further learning]
-        """
+        if key_vector is not None:
+            await self._cache_store(key_vector, content_data, scope)
         
-        self.set_prompt_template(
-            template=content_template,
-            input_variables=[
-                "system_prompt", "course_title", "course_description", 
-                "module_title", "lesson_title", "audience", "duration",
-                "research_info"
-            ]
-        )
+        return content_data
     
-    async def generate_lesson_content(
+    async def generate_lesson_content_streaming(
         self,
         course_title: str,
         course_description: str,
@@ -75,10 +162,17 @@ class ContentAgent(BaseAgent):
         lesson_title: str,
         research_data: Dict[str, Any],
         audience: str = "",
-        duration: str = ""
+        duration: str = "",
+        research_info: Optional[str] = None,
+        key_vector: Optional[Any] = None,
+        cache_checked: bool = False,
+        on_content: Optional[Callable[[str], Awaitable[None]]] = None
     ) -> Dict[str, Any]:
         """
-        Generate content for a specific lesson.
+        Generate content for a specific lesson, streaming the response.
+        
+        The lesson content is passed to on_content as soon as the RESOURCES section
+        starts, so callers can use it while the resources are still generated.
         
         Args:
             course_title: The title of the course
@@ -88,24 +182,279 @@ class ContentAgent(BaseAgent):
             research_data: Research data dictionary
             audience: The target audience for the course
             duration: The duration of the course
+            research_info: Research data already formatted with format_research_info
+            key_vector: Cache key embedding from lookup_cached_lessons, used to store
+                the result. None if the key could not be embedded
+            cache_checked: Whether lookup_cached_lessons already checked the cache,
+                so it is not looked up again even if embedding the key failed
+            on_content: Coroutine function called with the lesson content once it is complete
             
         Returns:
             Dictionary containing the lesson content and resources
         """
-        # Prepare research information
-        research_info = f"""
-        Summary:
-        {research_data.get('summary', '')}
+        if research_info is None:
+            research_info = self.format_research_info(research_data)
         
-        Key Concepts:
-        {self._format_list(research_data.get('key_concepts', []))}
+        scope = self._research_scope(research_info)
+        if not cache_checked:
+            key_vector, cached = await self._cache_lookup(
+                self._cache_key(course_title, module_title, lesson_title, audience), scope
+            )
+            if cached is not None:
+                logger.info("Semantic cache hit for lesson: %s", lesson_title)
+                if on_content is not None:
+                    await on_content(cached["content"])
+                return cached
         
-        Insights:
-        {research_data.get('insights', '')}
+        inputs = self._build_inputs(
+            course_title, course_description, module_title, lesson_title,
+            research_info, audience, duration
+        )
+        
+        # Accumulate chunks, watching for the start of the resources section
+        chunks = []
+        buffer = ""
+        search_from = 0
+        flushed = False
+        async for chunk in self.stream(inputs):
+            chunks.append(chunk)
+            if flushed:
+                continue
+            
+            buffer += chunk
+            marker_index = buffer.find(RESOURCES_MARKER, search_from)
+            if marker_index == -1:
+                # Keep enough overlap to catch a marker split across chunks
+                search_from = max(len(buffer) - len(RESOURCES_MARKER), 0)
+                continue
+            
+            content = buffer[:marker_index]
+            content_index = content.find(CONTENT_MARKER)
+            if content_index != -1:
+                content = content[content_index + len(CONTENT_MARKER):]
+            if on_content is not None:
+                await on_content(content.strip())
+            flushed = True
+        
+        # Parse the result into a structured format
+        content_data = await asyncio.to_thread(self._parse_content_result, "".join(chunks))
+        if not flushed and on_content is not None:
+            await on_content(content_data["content"])
+        
+        if key_vector is not None:
+            await self._cache_store(key_vector, content_data, scope)
+        
+        return content_data
+    
+    async def generate_lessons_batch(
+        self,
+        course_title: str,
+        course_description: str,
+        lessons: List[Tuple[str, str]],
+        research_data: Dict[str, Any],
+        audience: str = "",
+        duration: str = "",
+        poll_interval: float = 30.0
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        Generate content for many lessons through the OpenAI Batch API.
+        
+        The Batch API is cheaper than live calls but may take up to 24 hours,
+        so this is only suitable when latency is not critical.
+        
+        Args:
+            course_title: The title of the course
+            course_description: The course description
+            lessons: List of (module title, lesson title) pairs
+            research_data: Research data dictionary
+            audience: The target audience for the course
+            duration: The duration of the course
+            poll_interval: Seconds to wait between batch status checks
+            
+        Returns:
+            Lesson content dictionaries in the same order as the lessons,
+            with an exception in place of any lesson that failed
         """
+        research_info = self.format_research_info(research_data)
+        
+        # Build one chat completion request per lesson
+        batch_lines = []
+        for i, (module_title, lesson_title) in enumerate(lessons):
+            inputs = self._build_inputs(
+                course_title, course_description, module_title, lesson_title,
+                research_info, audience, duration
+            )
+            batch_lines.append(json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.model_name,
+                    "temperature": self.temperature,
+                    "messages": [
+                        {"role": "system" if message.type == "system" else "user", "content": message.content}
+                        for message in self.prompt_template.format_messages(**inputs)
+                    ]
+                }
+            }))
+        
+        client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=shared_httpx_client)
+        
+        input_file = await client.files.create(
+            file=("lessons.jsonl", "\n".join(batch_lines).encode()),
+            purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        logger.info("Submitted batch %s with %s lessons", batch.id, len(batch_lines))
+        
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(poll_interval)
+            batch = await client.batches.retrieve(batch.id)
+            logger.debug("Batch %s status: %s", batch.id, batch.status)
+        
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"Batch {batch.id} finished with status: {batch.status}")
         
-        inputs = {
-            "system_prompt": self.system_prompt,
+        output = await client.files.content(batch.output_file_id)
+        # Parsing every lesson of a course is CPU work, so keep it off the event loop
+        results = await asyncio.to_thread(self._parse_batch_output, output.text, len(lessons))
+        
+        logger.info("Batch %s completed", batch.id)
+        return results
+    
+    def _parse_batch_output(self, output: str, lesson_count: int) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        Parse a batch output file into lesson content.
+        
+        Args:
+            output: The JSONL batch output file
+            lesson_count: Number of lessons submitted in the batch
+            
+        Returns:
+            The parsed content for each lesson, or an exception for lessons that failed
+        """
+        # Match results back to lessons by custom_id, since output order is not guaranteed
+        results: List[Union[Dict[str, Any], Exception]] = [
+            RuntimeError("No result returned for lesson") for _ in range(lesson_count)
+        ]
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            index = int(item["custom_id"])
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                results[index] = RuntimeError(f"Batch request failed: {item.get('error') or response.get('body')}")
+                continue
+            
+            result = response["body"]["choices"][0]["message"]["content"]
+            results[index] = self._parse_content_result(result)
+        
+        return results
+    
+    async def lookup_cached_lessons(
+        self,
+        course_title: str,
+        lessons: List[Tuple[str, str]],
+        research_info: str,
+        audience: str = ""
+    ) -> List[Tuple[Optional[Any], Optional[Dict[str, Any]]]]:
+        """
+        Check the semantic cache for many lessons using a single embeddings request.
+        
+        Args:
+            course_title: The title of the course
+            lessons: List of (module title, lesson title) pairs
+            research_info: Research data formatted with format_research_info
+            audience: The target audience for the course
+            
+        Returns:
+            For each lesson, a tuple of its key embedding (None if embedding failed)
+            and the cached lesson content (None on a miss)
+        """
+        if not lessons:
+            return []
+        
+        keys = [
+            self._cache_key(course_title, module_title, lesson_title, audience)
+            for module_title, lesson_title in lessons
+        ]
+        scope = self._research_scope(research_info)
+        try:
+            key_vectors = await self.semantic_cache.embed_many(keys)
+        except Exception as e:
+            logger.warning("Semantic cache embedding failed: %s", e)
+            return [(None, None) for _ in lessons]
+        
+        async def probe(key_vector: Any) -> Tuple[Optional[Any], Optional[Dict[str, Any]]]:
+            try:
+                cached = await self.semantic_cache.lookup(key_vector, scope)
+                return key_vector, dict(cached) if cached is not None else None
+            except Exception as e:
+                logger.warning("Semantic cache lookup failed: %s", e)
+                return key_vector, None
+        
+        return list(await asyncio.gather(*(probe(key_vector) for key_vector in key_vectors)))
+    
+    def _cache_key(self, course_title: str, module_title: str, lesson_title: str, audience: str) -> str:
+        """Build the semantic cache key text for a lesson from its identity alone."""
+        return f"{course_title}|{module_title}|{lesson_title}|{audience}"
+    
+    @staticmethod
+    def _research_scope(research_info: str) -> str:
+        """
+        Hash the research block a lesson is generated from.
+        
+        The research is shared by every lesson of a course and would dominate the
+        key embedding, so it has to match exactly instead of being embedded.
+        """
+        return hashlib.blake2b(research_info.encode("utf-8"), digest_size=16).hexdigest()
+    
+    async def _cache_lookup(self, key_text: str, scope: str) -> Tuple[Optional[Any], Optional[Dict[str, Any]]]:
+        """
+        Look up a lesson in the semantic cache.
+        
+        Args:
+            key_text: Text identifying the lesson
+            scope: Hash of the research the lesson must have been generated from
+            
+        Returns:
+            Tuple of the key embedding (None if embedding failed) and the cached
+            lesson content (None on a miss)
+        """
+        key_vector = None
+        try:
+            key_vector = await self.semantic_cache.embed(key_text)
+            cached = await self.semantic_cache.lookup(key_vector, scope)
+            if cached is not None:
+                return key_vector, dict(cached)
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed: %s", e)
+        return key_vector, None
+    
+    async def _cache_store(self, key_vector: Any, content_data: Dict[str, Any], scope: str) -> None:
+        """Store generated lesson content in the semantic cache."""
+        try:
+            await self.semantic_cache.store(key_vector, content_data, scope)
+        except Exception as e:
+            logger.warning("Semantic cache store failed: %s", e)
+    
+    def _build_inputs(
+        self,
+        course_title: str,
+        course_description: str,
+        module_title: str,
+        lesson_title: str,
+        research_info: str,
+        audience: str,
+        duration: str
+    ) -> Dict[str, Any]:
+        """Build the prompt inputs for a lesson."""
+        return {
             "course_title": course_title,
             "course_description": course_description,
             "module_title": module_title,
@@ -114,13 +463,19 @@ class ContentAgent(BaseAgent):
             "duration": duration,
             "research_info": research_info
         }
+    
+    def format_research_info(self, research_data: Dict[str, Any]) -> str:
+        """Format the research data as a block of text for the lesson prompt."""
+        return f"""
+        Summary:
+        {research_data.get('summary', '')}
         
-        result = await self.run(inputs)
-        
-        # Parse the result into a structured format
-        content_data = self._parse_content_result(result)
+        Key Concepts:
+        {self._format_list(research_data.get('key_concepts', []))}
         
-        return content_data
+        Insights:
+        {research_data.get('insights', '')}
+        """
     
     def _format_list(self, items: List[str]) -> str:
         """Format a list of items as a string with bullet points."""
@@ -142,20 +497,15 @@ class ContentAgent(BaseAgent):
             "resources": []
         }
         
-        # Simple parsing based on section headers
-        if "CONTENT:" in result and "RESOURCES:" in result:
-            # Split by RESOURCES: to separate content and resources
-            parts = result.split("RESOURCES:")
+        # Single pass over the result to find both sections
+        match = _CONTENT_RE.search(result)
+        if match:
+            content_data["content"] = match.group("content")
             
-            if len(parts) >= 2:
-                # Get content (remove the CONTENT: prefix)
-                content_data["content"] = parts[0].replace("CONTENT:", "").strip()
-                
-                # Get resources
-                resources_text = parts[1].strip()
-                # Split by line and remove empty lines
-                resources = [line.strip() for line in resources_text.split("\n") if line.strip()]
-                content_data["resources"] = resources
+            # Split resources by line and remove empty lines
+            content_data["resources"] = [
+                line.strip() for line in _LINE_RE.split(match.group("resources")) if line.strip()
+            ]
         else:
             # Fallback if the format is not as expected
             content_data["content"] = result
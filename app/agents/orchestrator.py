@@ -1,16 +1,20 @@
 import asyncio
-from typing import Dict, Any, List, Optional, Tuple, cast
+import logging
+import os
+import time
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator, cast
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import BaseTool
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt.tool_node import ToolNode
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 from app.agents.research_agent import ResearchAgent
 from app.agents.structure_agent import StructureAgent
 from app.agents.content_agent import ContentAgent
-from app.agents.quality_agent import QualityAgent
+from app.agents.quality_agent import QualityAgent, REVIEW_CONCURRENCY_LIMIT
 from app.models.course import CourseResponse, Module, Lesson
-from app.utils.logging_utils import setup_logger, log_state
+from app.utils.logging_utils import setup_logger, log_state, LazyRepr
 
 # Set up logger
 logger = setup_logger("orchestrator")
@@ -18,6 +22,8 @@ logger = setup_logger("orchestrator")
 # Define the state for the graph
 class AgentState(BaseModel):
     """State object for the multi-agent graph."""
+    model_config = ConfigDict(arbitrary_types_allowed=True, validate_assignment=False, revalidate_instances="never")
+    
     brief: str = Field(..., description="The brief description of the course")
     target_audience: Optional[str] = Field(None, description="Target audience for the course")
     course_duration: Optional[str] = Field(None, description="Duration of the course")
@@ -26,214 +32,478 @@ class AgentState(BaseModel):
     content_data: Optional[Dict[str, List[Dict[str, Any]]]] = Field(None, description="Content for each module and lesson")
     final_course: Optional[Dict[str, Any]] = Field(None, description="Final course data")
     error: Optional[str] = Field(None, description="Error message if any")
+    batch_mode: bool = Field(False, description="Generate lesson content through the OpenAI Batch API")
+    quality_review: bool = Field(False, description="Review each module with the Quality Agent")
+    module_reviews: Optional[Dict[str, Dict[str, Any]]] = Field(None, description="Quality review for each module")
+
+class CourseAgents(BaseModel):
+    """The agents used to generate a course, created once and shared across requests."""
+    model_config = ConfigDict(arbitrary_types_allowed=True, frozen=True)
+    
+    research: ResearchAgent
+    structure: StructureAgent
+    content: ContentAgent
+    quality: QualityAgent
+
+def create_agents() -> CourseAgents:
+    """Create one instance of each agent."""
+    logger.info("Initializing agents...")
+    agents = CourseAgents(
+        research=ResearchAgent(),
+        structure=StructureAgent(),
+        content=ContentAgent(),
+        quality=QualityAgent()
+    )
+    logger.info("All agents initialized successfully")
+    return agents
+
+# Agents used when generate_course is called without explicit agents
+_default_agents: Optional[CourseAgents] = None
+
+def get_default_agents() -> CourseAgents:
+    """Return the process-wide agents, creating them on first use."""
+    global _default_agents
+    if _default_agents is None:
+        _default_agents = create_agents()
+    return _default_agents
+
+def _get_agents(config: RunnableConfig) -> CourseAgents:
+    """Return the agents passed to the graph run."""
+    return config["configurable"]["agents"]
 
-# Initialize agents
-logger.info("Initializing agents...")
-research_agent = ResearchAgent()
-structure_agent = StructureAgent()
-content_agent = ContentAgent()
-quality_agent = QualityAgent()
-logger.info("All agents initialized successfully")
+def _get_events(config: RunnableConfig) -> Optional[asyncio.Queue]:
+    """Return the queue that progress events are published to, if the run is being streamed."""
+    return config["configurable"].get("events")
+
+def _lesson_entry(lesson_title: str, lesson_content: Any) -> Dict[str, Any]:
+    """Build the content entry for a generated lesson, or an error entry if generation failed."""
+    if isinstance(lesson_content, BaseException):
+        return {
+            "title": lesson_title,
+            "content": f"Error generating content: {str(lesson_content)}",
+            "resources": []
+        }
+    return {
+        "title": lesson_title,
+        "content": lesson_content.get("content", ""),
+        "resources": lesson_content.get("resources", [])
+    }
+
+def _lesson_event(module_title: str, lesson_title: str, content: str) -> Dict[str, Any]:
+    """Build the event published when a lesson's content is complete."""
+    return {"type": "lesson", "module": module_title, "title": lesson_title, "content": content}
+
+async def _publish_module(
+    events: asyncio.Queue,
+    module_title: str,
+    lessons: List[Tuple[str, asyncio.Future]]
+) -> None:
+    """Publish a module event as soon as every lesson of the module has been generated."""
+    results = await asyncio.gather(*(future for _, future in lessons), return_exceptions=True)
+    await events.put({
+        "type": "module",
+        "module": {
+            "title": module_title,
+            "lessons": [_lesson_entry(lesson_title, result) for (lesson_title, _), result in zip(lessons, results)]
+        }
+    })
+
+class TokenBucket:
+    """Async token bucket limiting how many requests start per minute."""
+    
+    def __init__(self, rate_per_min: int):
+        """
+        Initialize the token bucket.
+        
+        Args:
+            rate_per_min: Maximum number of requests allowed per minute
+        """
+        self.capacity = max(rate_per_min, 1)
+        self.tokens = float(self.capacity)
+        self.refill_rate = self.capacity / 60.0
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        """Wait until a token is available and consume it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+                self.updated_at = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                # Sleep just long enough for the next token to be refilled
+                await asyncio.sleep((1 - self.tokens) / self.refill_rate)
+
+# Limit in-flight lesson generations and their request rate to stay under provider rate limits.
+# The limits are per worker process; with several workers each gets the full budget
+CONTENT_CONCURRENCY = int(os.getenv("COURSEGEN_CONCURRENCY", "8"))
+CONTENT_REQUESTS_PER_MIN = int(os.getenv("COURSEGEN_REQUESTS_PER_MIN", "60"))
+_sem = asyncio.Semaphore(CONTENT_CONCURRENCY)
+_bucket = TokenBucket(CONTENT_REQUESTS_PER_MIN)
+
+async def _generate_lesson(
+    content_agent: ContentAgent,
+    events: Optional[asyncio.Queue] = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """
+    Generate content for a single lesson within the concurrency and rate limits.
+    
+    When streaming, the response is streamed too and a "lesson" event is published
+    as soon as the lesson content is complete, before its resources are generated.
+    """
+    async with _sem:
+        await _bucket.acquire()
+        if events is None:
+            return await content_agent.generate_lesson_content(**kwargs)
+        
+        async def publish(content: str) -> None:
+            await events.put(_lesson_event(kwargs["module_title"], kwargs["lesson_title"], content))
+        
+        return await content_agent.generate_lesson_content_streaming(**kwargs, on_content=publish)
+
+# Limit in-flight module reviews
+_review_sem = asyncio.Semaphore(REVIEW_CONCURRENCY_LIMIT)
+
+async def _review_module(quality_agent: QualityAgent, **kwargs) -> Module:
+    """Review a single module within the concurrency limit."""
+    async with _review_sem:
+        return await quality_agent.review_module(**kwargs)
 
 # Define agent functions
-async def research_course_topic(state: AgentState) -> AgentState:
+async def research_course_topic(state: AgentState, config: RunnableConfig) -> AgentState:
     """Research the course topic."""
     try:
-        logger.info(f"Starting research for course topic: {state.brief}")
-        log_state(logger, state.dict(), "Initial")
+        logger.info("Starting research for course topic: %s", state.brief)
+        if logger.isEnabledFor(logging.DEBUG):
+            log_state(logger, state.model_dump(exclude={"research_data", "content_data"}, exclude_none=True), "Initial")
         
-        research_data = await research_agent.research_topic(
+        research_data = await _get_agents(config).research.research_topic(
             topic=state.brief,
             audience=state.target_audience or "",
             duration=state.course_duration or ""
         )
         
         logger.info("Research completed successfully")
-        logger.debug(f"Research data keys: {list(research_data.keys() if research_data else [])}")
+        logger.debug("Research data keys: %s", LazyRepr(lambda: list(research_data.keys() if research_data else [])))
         
-        new_state = AgentState(
-            brief=state.brief,
-            target_audience=state.target_audience,
-            course_duration=state.course_duration,
-            research_data=research_data
-        )
-        log_state(logger, new_state.dict(), "Final")
+        new_state = state.model_copy(update={"research_data": research_data})
+        if logger.isEnabledFor(logging.DEBUG):
+            log_state(logger, new_state.model_dump(exclude={"research_data", "content_data"}, exclude_none=True), "Final")
         return new_state
     except Exception as e:
-        logger.error(f"Research error: {str(e)}", exc_info=True)
-        return AgentState(
-            brief=state.brief,
-            target_audience=state.target_audience,
-            course_duration=state.course_duration,
-            error=f"Research error: {str(e)}"
-        )
+        logger.error("Research error: %s", e, exc_info=True)
+        return state.model_copy(update={"error": f"Research error: {str(e)}"})
 
-async def create_course_structure(state: AgentState) -> AgentState:
-    """Create the course structure."""
+async def _schedule_lessons(
+    state: AgentState,
+    content_agent: ContentAgent,
+    course_title: str,
+    course_description: str,
+    modules: List[Dict[str, Any]],
+    research_info: str,
+    events: Optional[asyncio.Queue] = None
+) -> List[Tuple[str, str, asyncio.Future]]:
+    """Start content generation for every lesson in the given modules, skipping cached lessons."""
+    lessons = []
+    for module in modules:
+        module_title = module.get("title", "")
+        module_lessons = module.get("lessons") or []
+        if not module_lessons:
+            logger.debug("Skipping module without lessons: %s", module_title)
+            continue
+        
+        logger.info("Processing module: %s", module_title)
+        for lesson in module_lessons:
+            lessons.append((module_title, lesson.get("title", "")))
+    
+    if not lessons:
+        return []
+    
+    # Embed all cache keys in one request and only call the LLM for misses
+    cache_results = await content_agent.lookup_cached_lessons(
+        course_title, lessons, research_info, audience=state.target_audience or ""
+    )
+    
+    tasks = []
+    for (module_title, lesson_title), (key_vector, cached) in zip(lessons, cache_results):
+        if cached is not None:
+            logger.info("Semantic cache hit for lesson: %s", lesson_title)
+            if events is not None:
+                await events.put(_lesson_event(module_title, lesson_title, cached.get("content", "")))
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(cached)
+            tasks.append((module_title, lesson_title, future))
+            continue
+        
+        logger.info("Generating content for lesson: %s", lesson_title)
+        task = asyncio.create_task(_generate_lesson(
+            content_agent,
+            events,
+            course_title=course_title,
+            course_description=course_description,
+            module_title=module_title,
+            lesson_title=lesson_title,
+            research_data=state.research_data,
+            audience=state.target_audience or "",
+            duration=state.course_duration or "",
+            research_info=research_info,
+            key_vector=key_vector,
+            cache_checked=True
+        ))
+        tasks.append((module_title, lesson_title, task))
+    
+    return tasks
+
+async def generate_course_content(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Create the course structure and generate content for the course."""
+    agents = _get_agents(config)
+    events = _get_events(config)
+    tasks = []
+    publishers = []
     try:
-        logger.info("Starting course structure creation")
-        log_state(logger, state.dict(), "Initial")
+        logger.info("Starting course content generation")
+        if logger.isEnabledFor(logging.DEBUG):
+            log_state(logger, state.model_dump(exclude={"research_data", "content_data"}, exclude_none=True), "Initial")
         
         if not state.research_data:
             logger.error("No research data available")
-            return AgentState(
-                brief=state.brief,
-                target_audience=state.target_audience,
-                course_duration=state.course_duration,
-                error="No research data available for creating course structure"
-            )
+            return state.model_copy(update={"error": "No research data available for creating course structure"})
         
-        course_structure = await structure_agent.create_structure(
-            topic=state.brief,
-            research_data=state.research_data,
-            audience=state.target_audience or "",
-            duration=state.course_duration or ""
-        )
+        # Format the research block once and share it across all lessons
+        research_info = agents.content.format_research_info(state.research_data)
         
-        logger.info("Course structure created successfully")
-        logger.debug(f"Structure keys: {list(course_structure.keys() if course_structure else [])}")
+        course_structure: Dict[str, Any] = {}
+        if state.batch_mode:
+            # Batch mode needs every lesson up front, so plan the whole structure first
+            logger.info("Starting course structure creation")
+            try:
+                course_structure = await agents.structure.create_structure(
+                    topic=state.brief,
+                    research_data=state.research_data,
+                    audience=state.target_audience or "",
+                    duration=state.course_duration or ""
+                )
+            except Exception as e:
+                logger.error("Structure creation error: %s", e, exc_info=True)
+                return state.model_copy(update={"error": f"Structure creation error: {str(e)}"})
+        else:
+            # Stream the structure and start each module's lessons as soon as it is planned,
+            # overlapping structure generation with content generation
+            logger.info("Starting course structure creation")
+            try:
+                async for course_structure, module in agents.structure.stream_structure(
+                    topic=state.brief,
+                    research_data=state.research_data,
+                    audience=state.target_audience or "",
+                    duration=state.course_duration or ""
+                ):
+                    if module is None:
+                        continue
+                    tasks.extend(await _schedule_lessons(
+                        state,
+                        agents.content,
+                        course_structure.get("course_title", ""),
+                        course_structure.get("course_description", ""),
+                        [module],
+                        research_info,
+                        events
+                    ))
+            except Exception as e:
+                logger.error("Structure creation error: %s", e, exc_info=True)
+                return state.model_copy(update={"error": f"Structure creation error: {str(e)}"})
+            
+            logger.info("Course structure created successfully")
+            logger.debug("Structure keys: %s", LazyRepr(lambda: list(course_structure.keys() if course_structure else [])))
         
-        new_state = AgentState(
-            brief=state.brief,
-            target_audience=state.target_audience,
-            course_duration=state.course_duration,
-            research_data=state.research_data,
-            course_structure=course_structure
-        )
-        log_state(logger, new_state.dict(), "Final")
+        modules = course_structure.get("modules", [])
+        logger.info("Generating content for %s modules", len(modules))
+        
+        if state.batch_mode:
+            lessons = [
+                (module.get("title", ""), lesson.get("title", ""))
+                for module in modules
+                for lesson in module.get("lessons", [])
+            ]
+            results = []
+            if lessons:
+                logger.info("Submitting %s lessons to the batch API", len(lessons))
+                results = await agents.content.generate_lessons_batch(
+                    course_title=course_structure.get("course_title", ""),
+                    course_description=course_structure.get("course_description", ""),
+                    lessons=lessons,
+                    research_data=state.research_data,
+                    audience=state.target_audience or "",
+                    duration=state.course_duration or ""
+                )
+        else:
+            lessons = [(module_title, lesson_title) for module_title, lesson_title, _ in tasks]
+            
+            # When streaming, publish each module as soon as its own lessons are done
+            if events is not None:
+                module_lessons = {}
+                for module_title, lesson_title, task in tasks:
+                    module_lessons.setdefault(module_title, []).append((lesson_title, task))
+                publishers = [
+                    asyncio.create_task(_publish_module(events, module_title, module_tasks))
+                    for module_title, module_tasks in module_lessons.items()
+                ]
+            
+            results = []
+            if tasks:
+                results = await asyncio.gather(*(task for _, _, task in tasks), return_exceptions=True)
+            await asyncio.gather(*publishers)
+        
+        # Group the results back by module, preserving lesson order
+        content_data = {module.get("title", ""): [] for module in modules}
+        for (module_title, lesson_title), lesson_content in zip(lessons, results):
+            if isinstance(lesson_content, BaseException):
+                logger.error("Error generating content for lesson '%s': %s", lesson_title, lesson_content, exc_info=lesson_content)
+            else:
+                logger.debug("Lesson content generated successfully for %s", lesson_title)
+            content_data[module_title].append(_lesson_entry(lesson_title, lesson_content))
+        
+        # Batch results all arrive together, so publish every module at once
+        if events is not None and state.batch_mode:
+            for module_title, module_lessons in content_data.items():
+                await events.put({"type": "module", "module": {"title": module_title, "lessons": module_lessons}})
+        
+        logger.info("Content generation completed")
+        new_state = state.model_copy(update={
+            "course_structure": course_structure,
+            "content_data": content_data
+        })
+        if logger.isEnabledFor(logging.DEBUG):
+            log_state(logger, new_state.model_dump(exclude={"research_data", "content_data"}, exclude_none=True), "Final")
         return new_state
     except Exception as e:
-        logger.error(f"Structure creation error: {str(e)}", exc_info=True)
-        return AgentState(
-            brief=state.brief,
-            target_audience=state.target_audience,
-            course_duration=state.course_duration,
-            research_data=state.research_data,
-            error=f"Structure creation error: {str(e)}"
-        )
+        logger.error("Content generation error: %s", e, exc_info=True)
+        return state.model_copy(update={"error": f"Content generation error: {str(e)}"})
+    finally:
+        # Don't leave lesson generations running if we bailed out early
+        for task in [task for _, _, task in tasks] + publishers:
+            if not task.done():
+                task.cancel()
 
-async def generate_course_content(state: AgentState) -> AgentState:
-    """Generate content for the course."""
+async def review_course_modules(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Review every module of the course, in one call or, when streaming, concurrently per module."""
+    if not state.quality_review:
+        return state
+    
     try:
-        logger.info("Starting course content generation")
-        log_state(logger, state.dict(), "Initial")
+        logger.info("Starting module quality review")
+        if logger.isEnabledFor(logging.DEBUG):
+            log_state(logger, state.model_dump(exclude={"research_data", "content_data"}, exclude_none=True), "Initial")
         
-        if not state.course_structure:
-            logger.error("No course structure available")
-            return AgentState(
-                brief=state.brief,
-                target_audience=state.target_audience,
-                course_duration=state.course_duration,
-                research_data=state.research_data,
-                error="No course structure available for generating content"
-            )
+        if not state.course_structure or not state.content_data:
+            logger.error("Missing course content for quality review")
+            return state
         
-        # Extract course information
         course_title = state.course_structure.get("course_title", "")
         course_description = state.course_structure.get("course_description", "")
-        modules = state.course_structure.get("modules", [])
+        module_titles = [title for title, lessons in state.content_data.items() if lessons]
+        modules = {
+            module_title: Module.model_construct(
+                title=module_title,
+                lessons=[Lesson.model_construct(**lesson) for lesson in state.content_data[module_title]]
+            )
+            for module_title in module_titles
+        }
+        quality_agent = _get_agents(config).quality
+        events = _get_events(config)
         
-        logger.info(f"Generating content for {len(modules)} modules")
-        content_data = {}
+        if events is None:
+            # Nothing is waiting on individual reviews, so review the whole course in one call
+            reviewed_course = await quality_agent.review_course(
+                CourseResponse.model_construct(
+                    course_title=course_title,
+                    description=course_description,
+                    modules=list(modules.values()),
+                    references=[]
+                ),
+                audience=state.target_audience or "",
+                duration=state.course_duration or ""
+            )
+            module_reviews = {
+                module.title: module.quality_review
+                for module in reviewed_course.modules
+                if module.quality_review
+            }
+            logger.info("Reviewed %s modules", len(module_reviews))
+            return state.model_copy(update={"module_reviews": module_reviews})
         
-        # Generate content for each module and lesson
-        for module in modules:
-            module_title = module.get("title", "")
-            logger.info(f"Processing module: {module_title}")
-            content_data[module_title] = []
-            
-            for lesson in module.get("lessons", []):
-                lesson_title = lesson.get("title", "")
-                logger.info(f"Generating content for lesson: {lesson_title}")
-                
-                try:
-                    lesson_content = await content_agent.generate_lesson_content(
-                        course_title=course_title,
-                        course_description=course_description,
-                        module_title=module_title,
-                        lesson_title=lesson_title,
-                        research_data=state.research_data,
-                        audience=state.target_audience or "",
-                        duration=state.course_duration or ""
-                    )
-                    
-                    logger.debug(f"Lesson content generated successfully for {lesson_title}")
-                    content_data[module_title].append({
-                        "title": lesson_title,
-                        "content": lesson_content.get("content", ""),
-                        "resources": lesson_content.get("resources", [])
-                    })
-                except Exception as e:
-                    logger.error(f"Error generating content for lesson '{lesson_title}': {str(e)}", exc_info=True)
-                    content_data[module_title].append({
-                        "title": lesson_title,
-                        "content": f"Error generating content: {str(e)}",
-                        "resources": []
-                    })
+        async def review(module_title: str) -> Module:
+            reviewed = await _review_module(
+                quality_agent,
+                course_title=course_title,
+                course_description=course_description,
+                module=modules[module_title],
+                audience=state.target_audience or "",
+                duration=state.course_duration or ""
+            )
+            # Publish each review as soon as it is ready
+            if reviewed.quality_review:
+                await events.put({"type": "review", "title": module_title, "quality_review": reviewed.quality_review})
+            return reviewed
         
-        logger.info("Content generation completed")
-        new_state = AgentState(
-            brief=state.brief,
-            target_audience=state.target_audience,
-            course_duration=state.course_duration,
-            research_data=state.research_data,
-            course_structure=state.course_structure,
-            content_data=content_data
+        # When streaming, review modules separately and concurrently so each review is sent as it lands
+        results = await asyncio.gather(
+            *(review(module_title) for module_title in module_titles),
+            return_exceptions=True
         )
-        log_state(logger, new_state.dict(), "Final")
-        return new_state
+        
+        module_reviews = {}
+        for module_title, result in zip(module_titles, results):
+            if isinstance(result, BaseException):
+                logger.error("Error reviewing module '%s': %s", module_title, result, exc_info=result)
+                continue
+            if result.quality_review:
+                module_reviews[module_title] = result.quality_review
+        
+        logger.info("Reviewed %s modules", len(module_reviews))
+        return state.model_copy(update={"module_reviews": module_reviews})
     except Exception as e:
-        logger.error(f"Content generation error: {str(e)}", exc_info=True)
-        return AgentState(
-            brief=state.brief,
-            target_audience=state.target_audience,
-            course_duration=state.course_duration,
-            research_data=state.research_data,
-            course_structure=state.course_structure,
-            error=f"Content generation error: {str(e)}"
-        )
+        logger.error("Quality review error: %s", e, exc_info=True)
+        return state.model_copy(update={"error": f"Quality review error: {str(e)}"})
 
 async def finalize_course(state: AgentState) -> AgentState:
     """Finalize the course by compiling all data."""
     try:
         logger.info("Starting course finalization")
-        log_state(logger, state.dict(), "Initial")
+        if logger.isEnabledFor(logging.DEBUG):
+            log_state(logger, state.model_dump(exclude={"research_data", "content_data"}, exclude_none=True), "Initial")
         
         if not state.course_structure:
             logger.error("Missing course structure")
-            return AgentState(
-                brief=state.brief,
-                target_audience=state.target_audience,
-                course_duration=state.course_duration,
-                research_data=state.research_data,
-                error="Missing course structure for finalizing the course"
-            )
+            return state.model_copy(update={"error": "Missing course structure for finalizing the course"})
             
         if not state.content_data:
             logger.error("Missing content data")
-            return AgentState(
-                brief=state.brief,
-                target_audience=state.target_audience,
-                course_duration=state.course_duration,
-                research_data=state.research_data,
-                course_structure=state.course_structure,
-                error="Missing content data for finalizing the course"
-            )
+            return state.model_copy(update={"error": "Missing content data for finalizing the course"})
         
         # Extract course information
         course_title = state.course_structure.get("course_title", "")
         course_description = state.course_structure.get("course_description", "")
         modules_structure = state.course_structure.get("modules", [])
         
-        logger.info(f"Processing {len(modules_structure)} modules for final compilation")
+        logger.info("Processing %s modules for final compilation", len(modules_structure))
         modules = []
         
+        content_data = state.content_data
         for module_structure in modules_structure:
             module_title = module_structure.get("title", "")
-            logger.info(f"Finalizing module: {module_title}")
+            logger.info("Finalizing module: %s", module_title)
             
-            lesson_content_list = state.content_data.get(module_title, [])
-            logger.debug(f"Found {len(lesson_content_list)} lessons for module {module_title}")
+            lesson_content_list = content_data.get(module_title, ())
+            if not lesson_content_list:
+                modules.append({"title": module_title, "lessons": []})
+                continue
+            logger.debug("Found %s lessons for module %s", len(lesson_content_list), module_title)
             
             lessons = []
             for lesson_data in lesson_content_list:
@@ -243,19 +513,21 @@ async def finalize_course(state: AgentState) -> AgentState:
                     "resources": lesson_data.get("resources", [])
                 }
                 lessons.append(lesson)
-                logger.debug(f"Added lesson: {lesson['title']}")
+                logger.debug("Added lesson: %s", lesson['title'])
             
             module = {
                 "title": module_title,
                 "lessons": lessons
             }
+            if state.module_reviews and module_title in state.module_reviews:
+                module["quality_review"] = state.module_reviews[module_title]
             modules.append(module)
         
         # Gather references
         references = []
         if state.research_data and "resources" in state.research_data:
             references = state.research_data.get("resources", [])
-            logger.debug(f"Added {len(references)} references")
+            logger.debug("Added %s references", len(references))
         
         final_course = {
             "course_title": course_title,
@@ -265,41 +537,13 @@ async def finalize_course(state: AgentState) -> AgentState:
         }
         
         logger.info("Course finalization completed successfully")
-        new_state = AgentState(
-            brief=state.brief,
-            target_audience=state.target_audience,
-            course_duration=state.course_duration,
-            research_data=state.research_data,
-            course_structure=state.course_structure,
-            content_data=state.content_data,
-            final_course=final_course
-        )
-        log_state(logger, new_state.dict(), "Final")
+        new_state = state.model_copy(update={"final_course": final_course})
+        if logger.isEnabledFor(logging.DEBUG):
+            log_state(logger, new_state.model_dump(exclude={"research_data", "content_data"}, exclude_none=True), "Final")
         return new_state
     except Exception as e:
-        logger.error(f"Course finalization error: {str(e)}", exc_info=True)
-        return AgentState(
-            brief=state.brief,
-            target_audience=state.target_audience,
-            course_duration=state.course_duration,
-            research_data=state.research_data,
-            course_structure=state.course_structure,
-            content_data=state.content_data,
-            error=f"Course finalization error: {str(e)}"
-        )
-
-def should_end(state: AgentState) -> str:
-    """Determine if the workflow should end."""
-    if state.error:
-        logger.error(f"Workflow ended with error: {state.error}")
-        return "end"
-    
-    if state.final_course:
-        logger.info("Workflow completed successfully")
-        return "end"
-    
-    logger.debug("Workflow continuing")
-    return "continue"
+        logger.error("Course finalization error: %s", e, exc_info=True)
+        return state.model_copy(update={"error": f"Course finalization error: {str(e)}"})
 
 # Build the graph
 def build_course_generation_graph() -> StateGraph:
@@ -308,34 +552,31 @@ def build_course_generation_graph() -> StateGraph:
     
     # Add nodes
     workflow.add_node("research", research_course_topic)
-    workflow.add_node("structure", create_course_structure)
     workflow.add_node("content", generate_course_content)
+    workflow.add_node("review", review_course_modules)
     workflow.add_node("finalize", finalize_course)
     
     # Add edges
-    workflow.add_edge("research", "structure")
-    workflow.add_edge("structure", "content")
-    workflow.add_edge("content", "finalize")
-    
-    # Set conditional edges
-    workflow.add_conditional_edges(
-        "finalize",
-        should_end,
-        {
-            "end": END,
-            "continue": "finalize"
-        }
-    )
+    workflow.add_edge("research", "content")
+    workflow.add_edge("content", "review")
+    workflow.add_edge("review", "finalize")
+    workflow.add_edge("finalize", END)
     
     workflow.set_entry_point("research")
     
     return workflow
 
+# The graph only depends on code, so build and compile it once at import time
+_COMPILED_APP = build_course_generation_graph().compile()
+
 # Main function to generate a course
 async def generate_course(
     brief: str,
     target_audience: Optional[str] = None,
-    course_duration: Optional[str] = None
+    course_duration: Optional[str] = None,
+    batch_mode: bool = False,
+    quality_review: bool = False,
+    agents: Optional[CourseAgents] = None
 ) -> CourseResponse:
     """
     Generate a complete educational course based on a brief description.
@@ -344,45 +585,50 @@ async def generate_course(
         brief: Brief description of the course
         target_audience: Target audience for the course
         course_duration: Duration of the course
+        batch_mode: Generate lesson content through the cheaper but slower
+            OpenAI Batch API instead of live calls
+        quality_review: Review each module with the Quality Agent and include
+            the reviews in the response
+        agents: Agents to generate the course with, defaulting to the
+            process-wide agents
         
     Returns:
         A CourseResponse object containing the generated course
     """
-    logger.info(f"Generating course for: {brief}")
+    logger.info("Generating course for: %s", brief)
     
     try:
         # Initialize the state
         initial_state = AgentState(
             brief=brief,
             target_audience=target_audience,
-            course_duration=course_duration
+            course_duration=course_duration,
+            batch_mode=batch_mode,
+            quality_review=quality_review
         )
         
-        # Build the graph
-        workflow = build_course_generation_graph()
-        
-        # Compile the graph
-        app = workflow.compile()
-        
         # Run the graph
-        result = await app.ainvoke(initial_state)
+        result = await _COMPILED_APP.ainvoke(
+            initial_state,
+            config={"configurable": {"agents": agents or get_default_agents()}}
+        )
         
-        # Convert result dict to AgentState
-        result_dict = dict(result)
-        logger.debug(f"Result keys: {list(result_dict.keys())}")
+        # LangGraph returns the final state values as a mapping, so read it directly
+        logger.debug("Result keys: %s", LazyRepr(lambda: list(result.keys())))
         
-        if result_dict.get("error"):
-            logger.error(f"Course generation failed: {result_dict['error']}")
-            raise Exception(f"Course generation failed: {result_dict['error']}")
+        error = result.get("error")
+        if error:
+            logger.error("Course generation failed: %s", error)
+            raise Exception(f"Course generation failed: {error}")
         
-        final_course_data = result_dict.get("final_course")
+        final_course_data = result.get("final_course")
         if not final_course_data:
             logger.error("Course generation failed: No final course data available")
             raise Exception("Course generation failed: No final course data available")
         
         # Convert the final course data to a CourseResponse object
         logger.debug("Converting final course data to CourseResponse")
-        logger.debug(f"Final course data keys: {list(final_course_data.keys())}")
+        logger.debug("Final course data keys: %s", LazyRepr(lambda: list(final_course_data.keys())))
         
         # Convert modules
         modules = []
@@ -396,15 +642,16 @@ async def generate_course(
                     resources=lesson_data.get("resources", [])
                 )
                 lessons.append(lesson)
-                logger.debug(f"Created lesson: {lesson.title}")
+                logger.debug("Created lesson: %s", lesson.title)
             
             # Create module
             module = Module(
                 title=module_data.get("title", ""),
-                lessons=lessons
+                lessons=lessons,
+                quality_review=module_data.get("quality_review")
             )
             modules.append(module)
-            logger.debug(f"Created module: {module.title} with {len(module.lessons)} lessons")
+            logger.debug("Created module: %s with %s lessons", module.title, len(module.lessons))
         
         # Create course response
         course_response = CourseResponse(
@@ -415,9 +662,91 @@ async def generate_course(
         )
         
         logger.info("Successfully created CourseResponse object")
-        logger.debug(f"Course has {len(course_response.modules)} modules")
+        logger.debug("Course has %s modules", len(course_response.modules))
         return course_response
         
     except Exception as e:
-        logger.error(f"Error in generate_course: {str(e)}", exc_info=True)
-        raise 
\ No newline at end of file
+        logger.error("Error in generate_course: %s", e, exc_info=True)
+        raise 
+
+async def generate_course_stream(
+    brief: str,
+    target_audience: Optional[str] = None,
+    course_duration: Optional[str] = None,
+    batch_mode: bool = False,
+    quality_review: bool = False,
+    agents: Optional[CourseAgents] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Generate a course, yielding progress events as parts of it are completed.
+    
+    Args:
+        brief: Brief description of the course
+        target_audience: Target audience for the course
+        course_duration: Duration of the course
+        batch_mode: Generate lesson content through the cheaper but slower
+            OpenAI Batch API instead of live calls
+        quality_review: Review each module with the Quality Agent and stream
+            the reviews as they complete
+        agents: Agents to generate the course with, defaulting to the
+            process-wide agents
+        
+    Yields:
+        A "lesson" event with each lesson's content as soon as it is written,
+        a "module" event for each module once all of its lessons are generated,
+        a "review" event for each module review, and finally either a "course"
+        event with the course details or an "error" event
+    """
+    logger.info("Streaming course generation for: %s", brief)
+    
+    events: asyncio.Queue = asyncio.Queue()
+    initial_state = AgentState(
+        brief=brief,
+        target_audience=target_audience,
+        course_duration=course_duration,
+        batch_mode=batch_mode,
+        quality_review=quality_review
+    )
+    run = asyncio.create_task(_COMPILED_APP.ainvoke(
+        initial_state,
+        config={"configurable": {"agents": agents or get_default_agents(), "events": events}}
+    ))
+    
+    try:
+        # Relay events while the graph runs
+        while True:
+            next_event = asyncio.create_task(events.get())
+            done, _ = await asyncio.wait({next_event, run}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event not in done:
+                next_event.cancel()
+                break
+            yield next_event.result()
+        
+        while not events.empty():
+            yield events.get_nowait()
+        
+        try:
+            result = run.result()
+        except Exception as e:
+            logger.error("Error in generate_course_stream: %s", e, exc_info=True)
+            yield {"type": "error", "detail": str(e)}
+            return
+        
+        error = result.get("error")
+        final_course_data = result.get("final_course")
+        if error or not final_course_data:
+            logger.error("Course generation failed: %s", error or "No final course data available")
+            yield {"type": "error", "detail": error or "No final course data available"}
+            return
+        
+        yield {
+            "type": "course",
+            "course_title": final_course_data.get("course_title", ""),
+            "description": final_course_data.get("description", ""),
+            "modules": [module.get("title", "") for module in final_course_data.get("modules", [])],
+            "references": final_course_data.get("references", [])
+        }
+    finally:
+        # Stop generating if the client went away
+        if not run.done():
+            run.cancel()
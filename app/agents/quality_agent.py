@@ -1,181 +1,296 @@
-from typing import Dict, Any, List
-from app.agents.base_agent import BaseAgent
-from app.models.course import CourseResponse, Module, Lesson
+import asyncio
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+from app.agents.base_agent import BaseAgent, get_prompt_template
+from app.models.course import CourseResponse, Module
+from app.utils.logging_utils import setup_logger
+
+# Set up logger
+logger = setup_logger("quality_agent")
+
+# Matches a review section header in the streamed response
+_HEADER_RE = re.compile(r"(?:^|\n)[ \t#*]*(MODULE REVIEW|IMPROVEMENTS|LESSON REVIEWS|REVISED CONTENT):\**")
+
+# Format of each lesson in the review prompt
+LESSON_TPL = """
+Lesson {number}: {title}
+
+Content:
+{content}
+
+Resources:
+{resources}
+
+---
+"""
+
+# Format of each module in the whole-course review prompt
+MODULE_TPL = """
+Module {number}: {title}
+
+{lessons}
+"""
+
+# Maximum number of module reviews in flight at once, per worker process
+REVIEW_CONCURRENCY_LIMIT = int(os.getenv("COURSEGEN_REVIEW_CONCURRENCY", "5"))
+
+_QUALITY_SYSTEM_PROMPT = """
+You are a Quality Agent responsible for reviewing and refining educational course content.
+Your task is to ensure that course content is accurate, comprehensive, and well-structured.
+
+Follow these guidelines:
+1. Check for factual accuracy and correctness
+2. Ensure content is comprehensive and covers all necessary aspects
+3. Verify that the content is appropriate for the target audience
+4. Check for logical flow and coherence within and between lessons
+5. Look for gaps in content or explanations
+6. Ensure consistency in style and terminology
+7. Verify that resources are relevant and useful
+"""
+
+# Static instructions come first and every dynamic field follows the
+# input marker, so the prompt prefix is identical across modules
+_QUALITY_TEMPLATE = """
+Review the course module provided after the input marker and provide improvements.
+Focus on accuracy, comprehensiveness, appropriateness for the audience, and overall quality.
+
+Return your review and improvements in the following format:
+
+MODULE REVIEW:
+[Your overall assessment of the module]
+
+IMPROVEMENTS:
+[Specific improvements for the module as a whole]
+
+LESSON REVIEWS:
+[For each lesson, provide specific feedback and improvements]
+
+REVISED CONTENT:
+[Provide revised content for any lessons that need significant improvement]
+
+--- INPUT ---
+
+Course title: {course_title}
+
+Course Description: {course_description}
+
+Target audience: {audience}
+Course duration: {duration}
+
+Module: {module_title}
+
+{lessons_content}
+"""
+
+_QUALITY_INPUT_VARIABLES = [
+    "course_title", "course_description",
+    "module_title", "lessons_content", "audience", "duration"
+]
+
+# Reviews every module of a course in one call, answered as a JSON object
+_QUALITY_COURSE_TEMPLATE = """
+Review every course module provided after the input marker and provide improvements.
+Focus on accuracy, comprehensiveness, appropriateness for the audience, and overall quality.
+
+Return a JSON object with a "modules" array holding one entry per module, in this format:
+
+{{"modules": [{{"module_idx": 1, "review": "...", "improvements": "...", "revised": "..."}}]}}
+
+- module_idx: The module number as given in the input
+- review: Your overall assessment of the module
+- improvements: Specific improvements for the module as a whole
+- revised: Revised content for any lessons that need significant improvement
+
+Every value other than module_idx must be a string.
+
+--- INPUT ---
+
+Course title: {course_title}
+
+Course Description: {course_description}
+
+Target audience: {audience}
+Course duration: {duration}
+
+{modules_content}
+"""
+
+_QUALITY_COURSE_INPUT_VARIABLES = [
+    "course_title", "course_description",
+    "modules_content", "audience", "duration"
+]
 
 class QualityAgent(BaseAgent):
     """Agent responsible for reviewing and refining course content."""
     
     def __init__(self, model_name: str = "gpt-4o", temperature: float = 0.3):
         """Initialize the quality agent."""
-        system_prompt = """
-        You are a Quality Agent responsible for reviewing and refining educational course content.
-        Your task is to ensure that course content is accurate, comprehensive, and well-structured.
-        
-        Follow these guidelines:
-        1. Check for factual accuracy and correctness
-        2. Ensure content is comprehensive and covers all necessary aspects
-        3. Verify that the content is appropriate for the target audience
-        4. Check for logical flow and coherence within and between lessons
-        5. Look for gaps in content or explanations
-        6. Ensure consistency in style and terminology
-        7. Verify that resources are relevant and useful
-        """
-        
         super().__init__(
             name="Quality Agent",
-            system_prompt=system_prompt,
+            system_prompt=_QUALITY_SYSTEM_PROMPT,
             model_name=model_name,
             temperature=temperature
         )
         
         # Set a custom prompt template for the quality review task
-        quality_template = """
-        {system_prompt}
-        
-        You are reviewing a course titled: {course_title}
-        
-        Course Description: {course_description}
-        
-        Target audience: {audience}
-        Course duration: {duration}
-        
-        Please review the following module and its lessons:
-        
-        Module: {module_title}
-        
-        {lessons_content}
-        
-        Based on this information, review the content and provide improvements.
-        Focus on accuracy, comprehensiveness, appropriateness for the audience, and overall quality.
-        
-        Return your review and improvements in the following format:
-        
-        MODULE REVIEW:
-        [Your overall assessment of the module]
-        
-        IMPROVEMENTS:
-        [Specific improvements for the module as a whole]
-        
-        LESSON REVIEWS:
-        [For each lesson, provide specific feedback and improvements]
-        
-        REVISED CONTENT:
-        [Provide revised content for any lessons that need significant improvement]
-        """
-        
         self.set_prompt_template(
-            template=quality_template,
-            input_variables=[
-                "system_prompt", "course_title", "course_description", 
-                "module_title", "lessons_content", "audience", "duration"
-            ]
+            template=_QUALITY_TEMPLATE,
+            input_variables=_QUALITY_INPUT_VARIABLES
+        )
+        
+        # Prompt for whole-course reviews, which are answered in JSON so every
+        # module's review can be parsed in one go
+        self.course_prompt_template = get_prompt_template(
+            self.system_prompt, _QUALITY_COURSE_TEMPLATE, _QUALITY_COURSE_INPUT_VARIABLES
         )
     
     async def review_module(
         self,
         course_title: str,
         course_description: str,
-        module: Dict[str, Any],
+        module: Module,
         audience: str = "",
         duration: str = ""
-    ) -> Dict[str, Any]:
+    ) -> Module:
         """
         Review and refine a module and its lessons.
         
         Args:
             course_title: The title of the course
             course_description: The course description
-            module: The module dictionary with lessons
+            module: The module with its lessons
             audience: The target audience for the course
             duration: The duration of the course
             
         Returns:
-            Dictionary containing the reviewed and improved module
+            The reviewed module
         """
-        # Format lessons content for review
-        lessons_content = ""
-        for i, lesson in enumerate(module.get("lessons", [])):
-            lessons_content += f"""
-            Lesson {i+1}: {lesson.get('title', '')}
-            
-            Content:
-            {lesson.get('content', '')}
-            
-            Resources:
-            {self._format_list(lesson.get('resources', []))}
-            
-            ---
-            """
-        
         inputs = {
-            "system_prompt": self.system_prompt,
             "course_title": course_title,
             "course_description": course_description,
-            "module_title": module.get("title", ""),
-            "lessons_content": lessons_content,
+            "module_title": module.title,
+            "lessons_content": self._format_lessons(module),
             "audience": audience,
             "duration": duration
         }
         
-        result = await self.run(inputs)
+        # Collect each section as soon as it is complete instead of waiting for the full response
+        sections = {}
+        async for header, text in self.stream_sections(inputs, _HEADER_RE):
+            sections.setdefault(header, text)
         
-        # Parse the result and update the module
-        improved_module = self._parse_review_result(result, module)
+        # Update the module from the parsed sections
+        improved_module = self._apply_review_sections(sections, module)
         
         return improved_module
     
-    def _format_list(self, items: List[str]) -> str:
-        """Format a list of items as a string with bullet points."""
+    async def review_all_modules(self, course: CourseResponse, audience: str = "", duration: str = "") -> List[Module]:
+        """
+        Review every module of a course with a single LLM call.
+        
+        Args:
+            course: The course response object
+            audience: The target audience for the course
+            duration: The duration of the course
+            
+        Returns:
+            The reviewed modules, in the same order as the course modules
+        """
+        modules_content = "\n".join(
+            MODULE_TPL.format(number=i + 1, title=module.title, lessons=self._format_lessons(module))
+            for i, module in enumerate(course.modules)
+        )
+        
+        inputs = {
+            "course_title": course.course_title,
+            "course_description": course.description,
+            "modules_content": modules_content,
+            "audience": audience,
+            "duration": duration
+        }
+        
+        logger.info("Reviewing %s modules in one call", len(course.modules))
+        content = await self.run(
+            inputs,
+            prompt_template=self.course_prompt_template,
+            response_format={"type": "json_object"}
+        )
+        
+        reviews = {
+            int(item["module_idx"]): item
+            for item in json.loads(content).get("modules", [])
+        }
+        
+        improved_modules = []
+        for i, module in enumerate(course.modules):
+            review = reviews.get(i + 1)
+            if review is None:
+                logger.warning("No review returned for module '%s'", module.title)
+                improved_modules.append(module)
+                continue
+            
+            improved_modules.append(Module.model_construct(
+                title=module.title,
+                lessons=module.lessons,
+                quality_review={
+                    "module_review": str(review.get("review") or ""),
+                    "improvements": str(review.get("improvements") or ""),
+                    "revised_content_notes": str(review.get("revised") or "")
+                }
+            ))
+        
+        return improved_modules
+    
+    def _format_lessons(self, module: Module) -> str:
+        """Format a module's lessons for a review prompt."""
+        return "\n".join(
+            LESSON_TPL.format(
+                number=i + 1,
+                title=lesson.title,
+                content=lesson.content,
+                resources=self._format_list(tuple(lesson.resources))
+            )
+            for i, lesson in enumerate(module.lessons)
+        )
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _format_list(items: Tuple[str, ...]) -> str:
+        """Format a tuple of items as a string with bullet points."""
         return "\n".join([f"- {item}" for item in items])
     
-    def _parse_review_result(self, result: str, original_module: Dict[str, Any]) -> Dict[str, Any]:
+    def _apply_review_sections(self, sections: Dict[str, str], original_module: Module) -> Module:
         """
-        Parse the review result and update the module.
+        Update the module from parsed review sections.
         
         Args:
-            result: The raw review result
-            original_module: The original module dictionary
+            sections: Review section bodies keyed by header
+            original_module: The original module
             
         Returns:
-            Updated module dictionary
+            Updated module
         """
-        # Create a copy of the original module to update
-        module = dict(original_module)
-        
-        # Check if there's a REVISED CONTENT section
-        if "REVISED CONTENT:" in result:
-            # Split the result to get the revised content section
-            parts = result.split("REVISED CONTENT:")
-            if len(parts) >= 2:
-                revised_content = parts[1].strip()
-                
-                # This is a simplified implementation
-                # In a real system, you would need more sophisticated parsing
-                # to correctly match revised content to specific lessons
-                
-                # For now, we'll just add the improvement notes to each lesson
-                module_review = ""
-                improvements = ""
-                
-                if "MODULE REVIEW:" in result:
-                    module_review_parts = result.split("MODULE REVIEW:")[1].split("IMPROVEMENTS:")[0].strip()
-                    module_review = module_review_parts
-                
-                if "IMPROVEMENTS:" in result:
-                    improvements_parts = result.split("IMPROVEMENTS:")[1].split("LESSON REVIEWS:")[0].strip()
-                    improvements = improvements_parts
-                
-                # Add review notes to the module
-                module["quality_review"] = {
-                    "module_review": module_review,
-                    "improvements": improvements
-                }
-                
-                # For this simplified implementation, we'll just add the revised content
-                # as a note in the module for reference
-                module["quality_review"]["revised_content_notes"] = revised_content
+        # This is a simplified implementation
+        # In a real system, you would need more sophisticated parsing
+        # to correctly match revised content to specific lessons
         
-        return module
+        # Add review notes to the module, keeping any revised content
+        # as a note in the module for reference
+        quality_review = {
+            "module_review": sections.get("MODULE REVIEW", ""),
+            "improvements": sections.get("IMPROVEMENTS", ""),
+            "revised_content_notes": sections.get("REVISED CONTENT", "")
+        }
+        
+        # The lessons are unchanged and already validated, so reuse them without revalidating
+        return Module.model_construct(
+            title=original_module.title,
+            lessons=original_module.lessons,
+            quality_review=quality_review
+        )
     
     async def review_course(self, course: CourseResponse, audience: str = "", duration: str = "") -> CourseResponse:
         """
@@ -189,40 +304,55 @@ class QualityAgent(BaseAgent):
         Returns:
             Updated course response
         """
-        improved_modules = []
-        
-        for module in course.modules:
-            # Convert module to dict for processing
-            module_dict = {
-                "title": module.title,
-                "lessons": [{"title": lesson.title, "content": lesson.content, "resources": lesson.resources} 
-                            for lesson in module.lessons]
-            }
-            
-            # Review and improve the module
-            improved_module_dict = await self.review_module(
-                course_title=course.course_title,
-                course_description=course.description,
-                module=module_dict,
-                audience=audience,
-                duration=duration
-            )
-            
-            # Convert back to Module object
-            improved_lessons = [
-                Lesson(title=lesson.get("title"), content=lesson.get("content"), resources=lesson.get("resources", []))
-                for lesson in improved_module_dict.get("lessons", [])
-            ]
-            
-            improved_module = Module(title=improved_module_dict.get("title"), lessons=improved_lessons)
-            improved_modules.append(improved_module)
+        try:
+            # One call for the whole course shares the prompt prefix and saves a round-trip per module
+            improved_modules = await self.review_all_modules(course, audience=audience, duration=duration)
+        except Exception as e:
+            logger.warning("Whole-course review failed, reviewing modules individually: %s", e)
+            improved_modules = await self._review_modules_individually(course, audience=audience, duration=duration)
         
-        # Create updated course
-        improved_course = CourseResponse(
+        # Create updated course, reusing the already validated modules
+        improved_course = CourseResponse.model_construct(
             course_title=course.course_title,
             description=course.description,
             modules=improved_modules,
             references=course.references
         )
         
-        return improved_course 
\ No newline at end of file
+        return improved_course
+    
+    async def _review_modules_individually(
+        self,
+        course: CourseResponse,
+        audience: str = "",
+        duration: str = ""
+    ) -> List[Module]:
+        """Review each module of a course with its own concurrent LLM call."""
+        semaphore = asyncio.Semaphore(REVIEW_CONCURRENCY_LIMIT)
+        
+        async def review(module: Module) -> Module:
+            async with semaphore:
+                return await self.review_module(
+                    course_title=course.course_title,
+                    course_description=course.description,
+                    module=module,
+                    audience=audience,
+                    duration=duration
+                )
+        
+        # Modules are independent, so review them all concurrently
+        results = await asyncio.gather(
+            *(review(module) for module in course.modules),
+            return_exceptions=True
+        )
+        
+        improved_modules = []
+        for module, result in zip(course.modules, results):
+            if isinstance(result, BaseException):
+                # Keep the original module if its review failed
+                logger.error("Error reviewing module '%s': %s", module.title, result, exc_info=result)
+                improved_modules.append(module)
+            else:
+                improved_modules.append(result)
+        
+        return improved_modules
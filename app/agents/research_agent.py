@@ -1,70 +1,83 @@
+import re
 from typing import Dict, Any, List, Optional
 from app.agents.base_agent import BaseAgent
+from app.utils.semantic_cache import create_semantic_cache
 from app.utils.web_research import get_web_research_tool
-from app.utils.logging_utils import setup_logger
+from app.utils.logging_utils import setup_logger, LazyRepr
 
 # Set up logger
 logger = setup_logger("research_agent")
 
+# Matches a research section header in the streamed response
+_HEADER_RE = re.compile(r"(?:^|\n)[ \t#*]*(RESEARCH SUMMARY|KEY CONCEPTS|RESOURCES|INSIGHTS):\**")
+
+_RESEARCH_SYSTEM_PROMPT = """
+You are a Research Agent responsible for gathering accurate and relevant information from the web.
+Your task is to research topics thoroughly and provide comprehensive information that will be used to create educational content.
+
+Follow these guidelines:
+1. Focus on gathering information from reputable sources
+2. Ensure the information is up-to-date and accurate
+3. Collect a diverse range of perspectives and resources
+4. Organize the information in a clear and coherent manner
+5. Cite all sources properly
+6. Prioritize depth of understanding over breadth when researching specific topics
+"""
+
+_RESEARCH_TEMPLATE = """
+Your task is to research the following topic: {topic}
+
+Additional context:
+- Target audience: {audience}
+- Course duration: {duration}
+
+Based on this information and using the web research tools available to you, gather comprehensive information on this topic.
+
+Return your findings in the following format:
+
+RESEARCH SUMMARY:
+[A brief summary of what you found]
+
+KEY CONCEPTS:
+[List of key concepts with brief explanations]
+
+RESOURCES:
+[List of useful resources with URLs]
+
+INSIGHTS:
+[Any additional insights or observations]
+"""
+
+_RESEARCH_INPUT_VARIABLES = ["topic", "audience", "duration"]
+
 class ResearchAgent(BaseAgent):
     """Agent responsible for researching content from the web."""
     
     def __init__(self, model_name: str = "gpt-4o", temperature: float = 0.5):
         """Initialize the research agent."""
-        system_prompt = """
-        You are a Research Agent responsible for gathering accurate and relevant information from the web.
-        Your task is to research topics thoroughly and provide comprehensive information that will be used to create educational content.
-        
-        Follow these guidelines:
-        1. Focus on gathering information from reputable sources
-        2. Ensure the information is up-to-date and accurate
-        3. Collect a diverse range of perspectives and resources
-        4. Organize the information in a clear and coherent manner
-        5. Cite all sources properly
-        6. Prioritize depth of understanding over breadth when researching specific topics
-        """
-        
         # Get the web research tool
         web_research_tool = get_web_research_tool()
         
         super().__init__(
             name="Research Agent",
-            system_prompt=system_prompt,
+            system_prompt=_RESEARCH_SYSTEM_PROMPT,
             model_name=model_name,
             temperature=temperature,
             tools=[web_research_tool]
         )
         
         # Set a custom prompt template for the research task
-        research_template = """
-        {system_prompt}
-        
-        Your task is to research the following topic: {topic}
-        
-        Additional context:
-        - Target audience: {audience}
-        - Course duration: {duration}
-        
-        Based on this information and using the web research tools available to you, gather comprehensive information on this topic.
-        
-        Return your findings in the following format:
-        
-        RESEARCH SUMMARY:
-        [A brief summary of what you found]
-        
-        KEY CONCEPTS:
-        [List of key concepts with brief explanations]
-        
-        RESOURCES:
-        [List of useful resources with URLs]
-        
-        INSIGHTS:
-        [Any additional insights or observations]
-        """
-        
         self.set_prompt_template(
-            template=research_template,
-            input_variables=["system_prompt", "topic", "audience", "duration"]
+            template=_RESEARCH_TEMPLATE,
+            input_variables=_RESEARCH_INPUT_VARIABLES
+        )
+        
+        # Cache research so semantically similar topics skip the LLM
+        self.semantic_cache = create_semantic_cache(
+            collection_name="course_gen_research",
+            model_name=model_name,
+            temperature=temperature,
+            threshold=0.92
         )
         
         logger.info("Research Agent initialized")
@@ -82,82 +95,78 @@ class ResearchAgent(BaseAgent):
             Dictionary containing research results
         """
         try:
-            logger.info(f"Starting research for topic: {topic}")
-            logger.debug(f"Audience: {audience}")
-            logger.debug(f"Duration: {duration}")
+            logger.info("Starting research for topic: %s", topic)
+            logger.debug("Audience: %s", audience)
+            logger.debug("Duration: %s", duration)
+            
+            # Return cached research for a semantically similar request
+            key_vector = None
+            try:
+                key_vector = await self.semantic_cache.embed(self._cache_key(topic, audience, duration))
+                cached = await self.semantic_cache.lookup(key_vector)
+                if cached is not None:
+                    logger.info("Using cached research for topic: %s", topic)
+                    return dict(cached)
+            except Exception as e:
+                logger.warning("Semantic cache lookup failed: %s", e)
             
             inputs = {
-                "system_prompt": self.system_prompt,
                 "topic": topic,
                 "audience": audience,
                 "duration": duration
             }
             
-            logger.debug("Sending research prompt to LLM")
-            result = await self.run(inputs)
-            logger.debug("Received response from LLM")
+            logger.debug("Streaming research prompt to LLM")
+            research_data = self._empty_research_data()
             
-            # Parse the result into a structured format
-            research_data = self._parse_research_result(result)
+            # Parse each section as soon as it is complete instead of waiting for the full response
+            async for header, text in self.stream_sections(inputs, _HEADER_RE):
+                self._apply_section(research_data, header, text)
             
             logger.info("Successfully parsed research data")
-            logger.debug(f"Research data sections: {list(research_data.keys())}")
+            
+            if key_vector is not None:
+                try:
+                    await self.semantic_cache.store(key_vector, research_data)
+                except Exception as e:
+                    logger.warning("Semantic cache store failed: %s", e)
+            logger.debug("Research data sections: %s", LazyRepr(lambda: list(research_data.keys())))
             return research_data
             
         except Exception as e:
-            logger.error(f"Error during research: {str(e)}", exc_info=True)
+            logger.error("Error during research: %s", e, exc_info=True)
             return {
                 "error": f"Research failed: {str(e)}"
             }
     
-    def _parse_research_result(self, result: str) -> Dict[str, Any]:
-        """
-        Parse the research result into a structured format.
-        
-        Args:
-            result: The raw research result
-            
-        Returns:
-            Structured research data
-        """
-        # Initialize the research data
-        research_data = {
+    def _cache_key(self, topic: str, audience: str, duration: str) -> str:
+        """Build the semantic cache key text for a research request."""
+        return "|".join(" ".join(part.lower().split()) for part in (topic, audience, duration))
+    
+    def _empty_research_data(self) -> Dict[str, Any]:
+        """Return research data with every section empty."""
+        return {
             "summary": "",
             "key_concepts": [],
             "resources": [],
             "insights": ""
         }
+    
+    def _apply_section(self, research_data: Dict[str, Any], header: str, text: str) -> None:
+        """
+        Store one parsed section in the research data.
         
-        # Simple parsing based on section headers
-        sections = result.split("\n\n")
-        current_section = None
-        
-        for section in sections:
-            if "RESEARCH SUMMARY:" in section:
-                current_section = "summary"
-                research_data["summary"] = section.replace("RESEARCH SUMMARY:", "").strip()
-            elif "KEY CONCEPTS:" in section:
-                current_section = "key_concepts"
-                concepts_text = section.replace("KEY CONCEPTS:", "").strip()
-                # Split by line and remove empty lines
-                research_data["key_concepts"] = [line.strip() for line in concepts_text.split("\n") if line.strip()]
-            elif "RESOURCES:" in section:
-                current_section = "resources"
-                resources_text = section.replace("RESOURCES:", "").strip()
-                # Split by line and remove empty lines
-                research_data["resources"] = [line.strip() for line in resources_text.split("\n") if line.strip()]
-            elif "INSIGHTS:" in section:
-                current_section = "insights"
-                research_data["insights"] = section.replace("INSIGHTS:", "").strip()
-            elif current_section:
-                # Append to the current section
-                if current_section == "summary":
-                    research_data["summary"] += "\n" + section
-                elif current_section == "key_concepts":
-                    research_data["key_concepts"].extend([line.strip() for line in section.split("\n") if line.strip()])
-                elif current_section == "resources":
-                    research_data["resources"].extend([line.strip() for line in section.split("\n") if line.strip()])
-                elif current_section == "insights":
-                    research_data["insights"] += "\n" + section
-        
-        return research_data 
\ No newline at end of file
+        Args:
+            research_data: The research data to update
+            header: The section header
+            text: The section body
+        """
+        if header == "RESEARCH SUMMARY":
+            research_data["summary"] = text
+        elif header == "KEY CONCEPTS":
+            # Split by line and remove empty lines
+            research_data["key_concepts"] = [line.strip() for line in text.split("\n") if line.strip()]
+        elif header == "RESOURCES":
+            research_data["resources"] = [line.strip() for line in text.split("\n") if line.strip()]
+        elif header == "INSIGHTS":
+            research_data["insights"] = text
@@ -1,33 +1,188 @@
-from typing import Dict, Any, List
+import asyncio
+import logging
+import re
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
 from app.agents.base_agent import BaseAgent
-from app.utils.logging_utils import setup_logger
+from app.utils.logging_utils import setup_logger, LazyRepr
 
 # Set up logger
 logger = setup_logger("structure_agent")
 
-class StructureAgent(BaseAgent):
-    """Agent responsible for organizing content into a logical course structure."""
+_STRUCTURE_SYSTEM_PROMPT = """
+You are a Structure Agent responsible for organizing educational content into a logical and effective course structure.
+Your task is to take research information and organize it into modules and lessons that follow sound pedagogical principles.
+
+Follow these guidelines:
+1. Organize content from simple to complex concepts
+2. Ensure a logical progression of topics
+3. Create a balanced distribution of content across modules
+4. Design a structure that aligns with the course duration
+5. Include practical applications and exercises where appropriate
+6. Consider the target audience's background and learning needs
+
+IMPORTANT: You must create exactly 5-6 modules, with 2-4 lessons each.
+"""
+
+# Static instructions come first and every dynamic field follows the
+# input marker, so the prompt prefix is identical across courses
+_STRUCTURE_TEMPLATE = """
+Using the research information provided after the input marker, create a comprehensive course structure with EXACTLY 5-6 modules.
+Each module MUST have 2-4 lessons that build logically upon each other.
+
+Return your course structure in EXACTLY this format:
+
+COURSE TITLE:
+[Your course title]
+
+COURSE DESCRIPTION:
+[Your course description]
+
+MODULE 1: [Module title]
+- Lesson 1.1: [Lesson title]
+- Lesson 1.2: [Lesson title]
+[Add more lessons if needed]
+
+MODULE 2: [Module title]
+- Lesson 2.1: [Lesson title]
+- Lesson 2.2: [Lesson title]
+[Add more lessons if needed]
+
+[Continue for all modules, ensuring you create 5-6 modules total]
+
+RATIONALE:
+[Your rationale]
+
+--- INPUT ---
+
+Course topic: {topic}
+
+Additional context:
+- Target audience: {audience}
+- Course duration: {duration}
+
+Research Summary: {research_summary}
+
+Key Concepts:
+{key_concepts}
+"""
+
+_STRUCTURE_INPUT_VARIABLES = [
+    "topic", "audience", "duration",
+    "research_summary", "key_concepts"
+]
+
+# Captures a lesson title, dropping the bullet and any "Lesson X.Y:" prefix
+_LESSON_RE = re.compile(r"^-\s*(?:Lesson\s+[\d.]+\s*:\s*)?(.+?)\s*$")
+
+# Headers of the free-text sections and the structure fields they fill
+_TEXT_HEADERS = (
+    ("COURSE TITLE:", "course_title"),
+    ("COURSE DESCRIPTION:", "course_description"),
+    ("RATIONALE:", "rationale")
+)
+
+class _StructureParser:
+    """Line-by-line state machine that builds the course structure in a single pass."""
     
-    def __init__(self, model_name: str = "gpt-4o", temperature: float = 0.4):
-        """Initialize the structure agent."""
-        system_prompt = """
-        You are a Structure Agent responsible for organizing educational content into a logical and effective course structure.
-        Your task is to take research information and organize it into modules and lessons that follow sound pedagogical principles.
+    def __init__(self):
+        """Initialize the parser with an empty structure."""
+        self.structure_data = {
+            "course_title": "",
+            "course_description": "",
+            "modules": [],
+            "rationale": ""
+        }
+        # Either a text field name, "module" while reading lessons, or None between sections
+        self._state: Optional[str] = None
+        self._module: Optional[Dict[str, Any]] = None
+        self._text: List[str] = []
+    
+    def feed(self, line: str) -> Optional[Dict[str, Any]]:
+        """
+        Consume one line of the raw structure result.
         
-        Follow these guidelines:
-        1. Organize content from simple to complex concepts
-        2. Ensure a logical progression of topics
-        3. Create a balanced distribution of content across modules
-        4. Design a structure that aligns with the course duration
-        5. Include practical applications and exercises where appropriate
-        6. Consider the target audience's background and learning needs
+        Args:
+            line: A single line of the raw result
+            
+        Returns:
+            The module dictionary if this line completed a module, otherwise None
+        """
+        line = line.strip()
+        
+        for header, field in _TEXT_HEADERS:
+            if line.startswith(header):
+                completed = self.close()
+                self._state = field
+                self._text.append(line[len(header):])
+                return completed
         
-        IMPORTANT: You must create exactly 5-6 modules, with 2-4 lessons each.
+        if line.startswith("MODULE "):
+            completed = self.close()
+            logger.debug("Processing module: %s...", line[:50])
+            self._state = "module"
+            self._module = {
+                "title": line,
+                "lessons": []
+            }
+            return completed
+        
+        if self._state == "module":
+            # A blank line after the lessons ends the module
+            if not line:
+                return self.close() if self._module["lessons"] else None
+            
+            match = _LESSON_RE.match(line)
+            if match:
+                lesson_title = match.group(1)
+                self._module["lessons"].append({
+                    "title": lesson_title,
+                    "content": ""  # Will be filled by the content agent
+                })
+                logger.debug("Added lesson: %s", lesson_title)
+        elif self._state is not None:
+            # A blank line after the text ends the section, so unrecognised
+            # lines that follow are not absorbed into it
+            if not line:
+                return self.close() if any(text.strip() for text in self._text) else None
+            self._text.append(line)
+        
+        return None
+    
+    def close(self) -> Optional[Dict[str, Any]]:
+        """
+        Finish the section currently being read.
+        
+        Returns:
+            The module dictionary if a module was completed, otherwise None
         """
+        completed = None
+        if self._state == "module":
+            self.structure_data["modules"].append(self._module)
+            logger.debug("Added module '%s' with %s lessons", self._module['title'], len(self._module['lessons']))
+            completed = self._module
+        elif self._state == "course_title":
+            # The title is a single line
+            self.structure_data["course_title"] = next(
+                (text.strip() for text in self._text if text.strip()), ""
+            )
+            logger.debug("Found %s", self._state)
+        elif self._state is not None:
+            self.structure_data[self._state] = "\n".join(self._text).strip()
+            logger.debug("Found %s", self._state)
         
+        self._state = None
+        self._module = None
+        self._text = []
+        return completed
+
+class StructureAgent(BaseAgent):
+    """Agent responsible for organizing content into a logical course structure."""
+    
+    def __init__(self, model_name: str = "gpt-4o", temperature: float = 0.4):
+        """Initialize the structure agent."""
         super().__init__(
             name="Structure Agent",
-            system_prompt=system_prompt,
+            system_prompt=_STRUCTURE_SYSTEM_PROMPT,
             model_name=model_name,
             temperature=temperature
         )
@@ -35,53 +190,9 @@ class StructureAgent(BaseAgent):
         logger.info("Structure Agent initialized")
         
         # Set a custom prompt template for the structure task
-        structure_template = """
-        {system_prompt}
-        
-        You have been provided with research information about a course on: {topic}
-        
-        Additional context:
-        - Target audience: {audience}
-        - Course duration: {duration}
-        
-        Research Summary: {research_summary}
-        
-        Key Concepts:
-        {key_concepts}
-        
-        Based on this information, create a comprehensive course structure with EXACTLY 5-6 modules.
-        Each module MUST have 2-4 lessons that build logically upon each other.
-        
-        Return your course structure in EXACTLY this format:
-        
-        COURSE TITLE:
-        [Your course title]
-        
-        COURSE DESCRIPTION:
-        [Your course description]
-        
-        MODULE 1: [Module title]
-        - Lesson 1.1: [Lesson title]
-        - Lesson 1.2: [Lesson title]
-        [Add more lessons if needed]
-        
-        MODULE 2: [Module title]
-        - Lesson 2.1: [Lesson title]
-        - Lesson 2.2: [Lesson title]
-        [Add more lessons if needed]
-        
-        [Continue for all modules, ensuring you create 5-6 modules total]
-        
-        RATIONALE:
-        [Your rationale]
-        """
-        
         self.set_prompt_template(
-            template=structure_template,
-            input_variables=[
-                "system_prompt", "topic", "audience", "duration", 
-                "research_summary", "key_concepts"
-            ]
+            template=_STRUCTURE_TEMPLATE,
+            input_variables=_STRUCTURE_INPUT_VARIABLES
         )
     
     async def create_structure(
@@ -104,45 +215,103 @@ class StructureAgent(BaseAgent):
             Dictionary containing the course structure
         """
         try:
-            logger.info(f"Creating structure for topic: {topic}")
-            logger.debug(f"Research data keys: {list(research_data.keys())}")
-            
-            # Extract relevant information from research data
-            research_summary = research_data.get("summary", "")
-            logger.debug(f"Research summary length: {len(research_summary)}")
-            
-            # Format key concepts as a string
-            key_concepts_list = research_data.get("key_concepts", [])
-            logger.debug(f"Number of key concepts: {len(key_concepts_list)}")
-            key_concepts = "\n".join([f"- {concept}" for concept in key_concepts_list])
-            
-            inputs = {
-                "system_prompt": self.system_prompt,
-                "topic": topic,
-                "audience": audience,
-                "duration": duration,
-                "research_summary": research_summary,
-                "key_concepts": key_concepts
-            }
+            logger.info("Creating structure for topic: %s", topic)
+            inputs = self._build_inputs(topic, research_data, audience, duration)
             
             logger.debug("Sending structure prompt to LLM")
             result = await self.run(inputs)
-            logger.debug(f"Received response from LLM (length: {len(result)})")
-            logger.debug("Raw LLM response:")
-            logger.debug(result)
+            logger.debug("Received response from LLM (length: %s)", len(result))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Raw LLM response:")
+                logger.debug(result)
             
-            # Parse the result into a structured format
-            structure_data = self._parse_structure_result(result)
+            # Parse the result into a structured format off the event loop
+            structure_data = await asyncio.to_thread(self._parse_structure_result, result)
             
             logger.info("Structure creation completed")
-            logger.debug(f"Created {len(structure_data['modules'])} modules")
-            for module in structure_data['modules']:
-                logger.debug(f"Module '{module['title']}' has {len(module['lessons'])} lessons")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Created %s modules", len(structure_data['modules']))
+                for module in structure_data['modules']:
+                    logger.debug("Module '%s' has %s lessons", module['title'], len(module['lessons']))
             
             return structure_data
             
         except Exception as e:
-            logger.error(f"Error creating structure: {str(e)}", exc_info=True)
+            logger.error("Error creating structure: %s", e, exc_info=True)
+            raise
+    
+    def _build_inputs(
+        self,
+        topic: str,
+        research_data: Dict[str, Any],
+        audience: str,
+        duration: str
+    ) -> Dict[str, Any]:
+        """Build the prompt inputs for the structure task."""
+        logger.debug("Research data keys: %s", LazyRepr(lambda: list(research_data.keys())))
+        
+        # Extract relevant information from research data
+        research_summary = research_data.get("summary", "")
+        logger.debug("Research summary length: %s", len(research_summary))
+        
+        # Format key concepts as a string
+        key_concepts_list = research_data.get("key_concepts", [])
+        logger.debug("Number of key concepts: %s", len(key_concepts_list))
+        key_concepts = "\n".join([f"- {concept}" for concept in key_concepts_list])
+        
+        return {
+            "topic": topic,
+            "audience": audience,
+            "duration": duration,
+            "research_summary": research_summary,
+            "key_concepts": key_concepts
+        }
+    
+    async def stream_structure(
+        self,
+        topic: str,
+        research_data: Dict[str, Any],
+        audience: str = "",
+        duration: str = ""
+    ) -> AsyncIterator[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """
+        Create a course structure, yielding each module as soon as it is planned.
+        
+        Args:
+            topic: The course topic
+            research_data: Research data dictionary
+            audience: The target audience for the course
+            duration: The duration of the course
+            
+        Yields:
+            Tuples of the structure parsed so far and the module just completed.
+            The final tuple carries the complete structure and None as the module.
+        """
+        try:
+            logger.info("Streaming structure for topic: %s", topic)
+            inputs = self._build_inputs(topic, research_data, audience, duration)
+            parser = _StructureParser()
+            structure_data = parser.structure_data
+            
+            # Feed each line to the parser as soon as it is complete
+            buffer = ""
+            async for chunk in self.stream(inputs):
+                buffer += chunk
+                *lines, buffer = buffer.split("\n")
+                for line in lines:
+                    module = parser.feed(line)
+                    if module:
+                        yield structure_data, module
+            
+            for module in (parser.feed(buffer), parser.close()):
+                if module:
+                    yield structure_data, module
+            
+            logger.info("Structure streaming completed with %s modules", len(structure_data['modules']))
+            yield structure_data, None
+            
+        except Exception as e:
+            logger.error("Error streaming structure: %s", e, exc_info=True)
             raise
     
     def _parse_structure_result(self, result: str) -> Dict[str, Any]:
@@ -158,71 +327,16 @@ class StructureAgent(BaseAgent):
         try:
             logger.debug("Starting to parse structure result")
             
-            # Initialize the structure data
-            structure_data = {
-                "course_title": "",
-                "course_description": "",
-                "modules": [],
-                "rationale": ""
-            }
+            # Build the structure in a single pass over the lines
+            parser = _StructureParser()
+            for line in result.splitlines():
+                parser.feed(line)
+            parser.close()
+            structure_data = parser.structure_data
             
-            # Simple parsing based on section headers
-            sections = result.split("\n\n")
-            logger.debug(f"Split result into {len(sections)} sections")
-            
-            current_section = None
-            current_module = None
-            
-            for section in sections:
-                section = section.strip()
-                logger.debug(f"Processing section starting with: {section[:50]}...")
-                
-                if "COURSE TITLE:" in section:
-                    structure_data["course_title"] = section.replace("COURSE TITLE:", "").strip()
-                    logger.debug(f"Found course title: {structure_data['course_title']}")
-                elif "COURSE DESCRIPTION:" in section:
-                    structure_data["course_description"] = section.replace("COURSE DESCRIPTION:", "").strip()
-                    logger.debug("Found course description")
-                elif "RATIONALE:" in section:
-                    structure_data["rationale"] = section.replace("RATIONALE:", "").strip()
-                    logger.debug("Found rationale")
-                elif section.startswith("MODULE "):
-                    logger.debug(f"Processing module section: {section[:50]}...")
-                    # Start a new module
-                    lines = section.split("\n")
-                    module_title = lines[0].strip()
-                    
-                    current_module = {
-                        "title": module_title,
-                        "lessons": []
-                    }
-                    
-                    # Add lessons
-                    for i in range(1, len(lines)):
-                        lesson_line = lines[i].strip()
-                        if lesson_line.startswith("- Lesson ") or lesson_line.startswith("- "):
-                            # Extract lesson title (remove the "- Lesson X.Y: " prefix)
-                            lesson_parts = lesson_line.split(":", 1)
-                            if len(lesson_parts) > 1:
-                                lesson_title = lesson_parts[1].strip()
-                            else:
-                                # If no colon, just remove the dash
-                                lesson_title = lesson_line.replace("- ", "", 1).strip()
-                            
-                            lesson = {
-                                "title": lesson_title,
-                                "content": ""  # Will be filled by the content agent
-                            }
-                            
-                            current_module["lessons"].append(lesson)
-                            logger.debug(f"Added lesson: {lesson_title}")
-                    
-                    structure_data["modules"].append(current_module)
-                    logger.debug(f"Added module '{module_title}' with {len(current_module['lessons'])} lessons")
-            
-            logger.info(f"Parsing completed. Created {len(structure_data['modules'])} modules")
+            logger.info("Parsing completed. Created %s modules", len(structure_data['modules']))
             return structure_data
             
         except Exception as e:
-            logger.error(f"Error parsing structure result: {str(e)}", exc_info=True)
-            raise 
\ No newline at end of file
+            logger.error("Error parsing structure result: %s", e, exc_info=True)
+            raise
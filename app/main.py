@@ -1,18 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
-import os
-import uvicorn
 
+from app.agents.base_agent import shared_httpx_client
+from app.agents.orchestrator import create_agents
 from app.routers import course_router
+from app.utils.semantic_cache import cleanup_semantic_caches
+from app.utils.server import run_server
+from app.utils.web_research import cleanup_web_cache, get_web_researcher
 
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the agents once for the lifetime of the application."""
+    app.state.agents = create_agents()
+    web_cache_cleanup = asyncio.create_task(cleanup_web_cache())
+    semantic_cache_cleanup = asyncio.create_task(cleanup_semantic_caches())
+    yield
+    web_cache_cleanup.cancel()
+    semantic_cache_cleanup.cancel()
+    await shared_httpx_client.aclose()
+    await get_web_researcher().close()
+
 app = FastAPI(
     title="Course Generation API",
     description="A multi-agent system that generates educational courses from brief descriptions",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # Course responses carry many KB of lesson text, so encode them with orjson
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -38,5 +59,4 @@ async def health_check():
     return {"status": "healthy"}
 
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", 8000))
-    uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=True) 
\ No newline at end of file
+    run_server()
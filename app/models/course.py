@@ -1,26 +1,34 @@
-from typing import List, Optional
-from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, Field
 
 class CourseRequest(BaseModel):
     """Request model for course generation."""
     brief: str = Field(..., description="A brief description of the course")
     target_audience: Optional[str] = Field(None, description="The target audience for the course")
     course_duration: Optional[str] = Field(None, description="The duration of the course (e.g., '6 weeks')")
+    quality_review: bool = Field(False, description="Whether to review each module with the Quality Agent")
 
 class Lesson(BaseModel):
     """Model for a lesson within a module."""
+    model_config = ConfigDict(extra="ignore", populate_by_name=True)
+    
     title: str
     content: str
-    resources: List[str] = []
+    resources: List[str] = Field(default_factory=list)
 
 class Module(BaseModel):
     """Model for a course module."""
+    model_config = ConfigDict(extra="ignore", populate_by_name=True)
+    
     title: str
     lessons: List[Lesson]
+    quality_review: Optional[Dict[str, str]] = None
 
 class CourseResponse(BaseModel):
     """Response model for a generated course."""
+    model_config = ConfigDict(extra="ignore", populate_by_name=True)
+    
     course_title: str
     description: str
     modules: List[Module]
-    references: List[str] = [] 
\ No newline at end of file
+    references: List[str] = Field(default_factory=list) 
\ No newline at end of file
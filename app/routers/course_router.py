@@ -1,6 +1,11 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+import asyncio
+import hashlib
+from typing import Dict
+import orjson
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Request
+from fastapi.responses import StreamingResponse
 from app.models.course import CourseRequest, CourseResponse
-from app.agents.orchestrator import generate_course
+from app.agents.orchestrator import CourseAgents, generate_course, generate_course_stream
 
 router = APIRouter(
     prefix="/api/courses",
@@ -8,8 +13,16 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Course generations in progress, keyed by a hash of the request, so identical
+# concurrent requests share one pipeline run (within this worker process only)
+_inflight: Dict[str, "asyncio.Task[CourseResponse]"] = {}
+
+def get_agents(request: Request) -> CourseAgents:
+    """Return the agents created when the application started."""
+    return request.app.state.agents
+
 @router.post("/generate", response_model=CourseResponse)
-async def create_course(course_request: CourseRequest):
+async def create_course(course_request: CourseRequest, agents: CourseAgents = Depends(get_agents)):
     """
     Generate a course based on the provided brief description.
     
@@ -17,16 +30,46 @@ async def create_course(course_request: CourseRequest):
     a complete course structure with modules and content.
     """
     try:
-        # Call the multi-agent orchestrator to generate the course
-        course = await generate_course(
-            brief=course_request.brief,
-            target_audience=course_request.target_audience,
-            course_duration=course_request.course_duration
-        )
+        key = hashlib.blake2b(orjson.dumps(course_request.model_dump()), digest_size=16).hexdigest()
+        task = _inflight.get(key)
+        if task is None:
+            # Call the multi-agent orchestrator to generate the course
+            task = asyncio.create_task(generate_course(
+                brief=course_request.brief,
+                target_audience=course_request.target_audience,
+                course_duration=course_request.course_duration,
+                quality_review=course_request.quality_review,
+                agents=agents
+            ))
+            _inflight[key] = task
+            task.add_done_callback(lambda _: _inflight.pop(key, None))
+        
+        # Shield the shared run so one caller going away doesn't cancel it for the others
+        course = await asyncio.shield(task)
         return course
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate course: {str(e)}")
 
+@router.post("/generate/stream")
+async def stream_course(course_request: CourseRequest, agents: CourseAgents = Depends(get_agents)):
+    """
+    Generate a course, streaming it as newline-delimited JSON.
+    
+    Each module is sent as soon as its lessons are generated, followed by
+    module reviews when requested, and finally the course details.
+    """
+    async def ndjson():
+        async for event in generate_course_stream(
+            brief=course_request.brief,
+            target_audience=course_request.target_audience,
+            course_duration=course_request.course_duration,
+            quality_review=course_request.quality_review,
+            agents=agents
+        ):
+            yield orjson.dumps(event) + b"\n"
+    
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @router.get("/example", response_model=CourseResponse)
 async def get_example_course():
     """
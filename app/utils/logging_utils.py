@@ -1,15 +1,32 @@
 import logging
+import os
 import sys
-from typing import Any, Dict
+from typing import Any, Callable, Dict
+import orjson
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Minimum level logged by every app logger; DEBUG enables the workflow state dumps
+LOG_LEVEL = (os.getenv("LOG_LEVEL") or "INFO").upper()
 
 def setup_logger(name: str) -> logging.Logger:
     """Set up a logger with a specific format and handlers."""
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    
+    # Already configured by an earlier call (e.g. after a reload); adding
+    # another handler would write every record twice
+    if logger.handlers:
+        return logger
+    
+    logger.setLevel(LOG_LEVEL)
+    # Records are written by our own handler, so don't repeat them via the root logger
+    logger.propagate = False
 
     # Create handlers
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.DEBUG)
+    console_handler.setLevel(LOG_LEVEL)
 
     # Create formatters and add it to handlers
     formatter = logging.Formatter(
@@ -22,14 +39,27 @@ def setup_logger(name: str) -> logging.Logger:
 
     return logger
 
+class LazyRepr:
+    """Defer computing a log argument until the record is actually formatted."""
+    
+    def __init__(self, fn: Callable[[], Any]):
+        self.fn = fn
+    
+    def __str__(self) -> str:
+        return str(self.fn())
+
 def log_state(logger: logging.Logger, state: Dict[str, Any], prefix: str = "") -> None:
     """Log the current state of the workflow."""
-    logger.debug(f"{prefix} State Contents:")
-    for key, value in state.items():
-        if value is not None:
-            if isinstance(value, dict):
-                logger.debug(f"{prefix} {key}:")
-                for sub_key, sub_value in value.items():
-                    logger.debug(f"{prefix}   {sub_key}: {type(sub_value)}")
-            else:
-                logger.debug(f"{prefix} {key}: {type(value)}") 
\ No newline at end of file
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    
+    # One record per state, with nested dicts summarized a level deep
+    summary = {
+        key: (
+            {sub_key: type(sub_value).__name__ for sub_key, sub_value in value.items()}
+            if isinstance(value, dict) else type(value).__name__
+        )
+        for key, value in state.items()
+        if value is not None
+    }
+    logger.debug("%s state=%s", prefix, orjson.dumps(summary).decode())
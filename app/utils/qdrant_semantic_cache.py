@@ -0,0 +1,158 @@
+import asyncio
+import time
+import uuid
+from typing import Dict, Any, Optional
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    Distance, FieldCondition, Filter, FilterSelector, MatchValue, PointStruct, Range,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, VectorParams
+)
+from app.utils.logging_utils import setup_logger
+from app.utils.semantic_cache import SemanticCache, QDRANT_URL, QDRANT_API_KEY, SEMANTIC_CACHE_RETENTION
+
+# Set up logger
+logger = setup_logger("semantic_cache")
+
+class QdrantSemanticCache(SemanticCache):
+    """Semantic cache backed by Qdrant so hits are shared across processes."""
+    
+    def __init__(
+        self,
+        collection_name: str,
+        model_name: Optional[str] = None,
+        temperature: Optional[float] = None,
+        threshold: float = 0.9,
+        embedding_model: str = "text-embedding-3-small",
+        ttl: Optional[float] = None
+    ):
+        """
+        Initialize the Qdrant semantic cache.
+        
+        Args:
+            collection_name: Qdrant collection holding the cached entries
+            model_name: LLM model whose outputs are cached, stored with each entry
+            temperature: LLM temperature whose outputs are cached, stored with each entry
+            threshold: Minimum cosine similarity for a lookup to count as a hit
+            embedding_model: OpenAI embedding model used to embed cache keys
+            ttl: Seconds after which an entry is treated as stale, or None to keep entries forever
+        """
+        super().__init__(threshold=threshold, embedding_model=embedding_model, ttl=ttl)
+        self.collection_name = collection_name
+        self.model_name = model_name
+        self.temperature = temperature
+        self.client = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+        self._collection_ready = False
+        self._collection_lock = asyncio.Lock()
+        
+        # Only match entries generated with the same model and temperature
+        self._conditions = []
+        if model_name is not None:
+            self._conditions.append(FieldCondition(key="model", match=MatchValue(value=model_name)))
+        if temperature is not None:
+            # MatchValue only accepts bool, int and str, so match the float with a closed range
+            self._conditions.append(
+                FieldCondition(key="temperature", range=Range(gte=temperature, lte=temperature))
+            )
+    
+    async def lookup(self, vector: np.ndarray, scope: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find the cached value whose key is most similar to the given vector.
+        
+        Args:
+            vector: Normalized embedding of the cache key
+            scope: If given, only entries stored with exactly this scope can match
+            
+        Returns:
+            The cached value if its similarity is above the threshold, otherwise None
+        """
+        await self._ensure_collection(vector.shape[0])
+        
+        conditions = list(self._conditions)
+        if self.ttl is not None:
+            # Ignore entries older than the TTL
+            conditions.append(FieldCondition(key="created_at", range=Range(gte=time.time() - self.ttl)))
+        if scope is not None:
+            conditions.append(FieldCondition(key="scope", match=MatchValue(value=scope)))
+        
+        response = await self.client.query_points(
+            collection_name=self.collection_name,
+            query=vector.tolist(),
+            query_filter=Filter(must=conditions) if conditions else None,
+            limit=1,
+            score_threshold=self.threshold,
+            with_payload=True
+        )
+        hits = response.points
+        if not hits:
+            logger.debug("Qdrant semantic cache miss")
+            self.misses += 1
+            return None
+        
+        logger.debug("Qdrant semantic cache hit (score: %.3f)", hits[0].score)
+        self.hits += 1
+        payload = hits[0].payload or {}
+        return payload.get("value", {})
+    
+    async def store(self, vector: np.ndarray, value: Dict[str, Any], scope: Optional[str] = None) -> None:
+        """
+        Store a value in the cache.
+        
+        Args:
+            vector: Normalized embedding of the cache key
+            value: The value to cache
+            scope: Optional exact-match tag a later lookup must give to find this entry
+        """
+        await self._ensure_collection(vector.shape[0])
+        
+        await self.client.upsert(
+            collection_name=self.collection_name,
+            points=[PointStruct(
+                id=str(uuid.uuid4()),
+                vector=vector.tolist(),
+                payload={
+                    "value": value,
+                    "model": self.model_name,
+                    "temperature": self.temperature,
+                    "scope": scope,
+                    "created_at": time.time()
+                }
+            )]
+        )
+    
+    async def purge_expired(self) -> None:
+        """
+        Delete entries older than the TTL, or than SEMANTIC_CACHE_RETENTION if the
+        cache has no TTL, so the shared collection doesn't grow without bound.
+        """
+        if not await self.client.collection_exists(self.collection_name):
+            return
+        
+        max_age = self.ttl if self.ttl is not None else SEMANTIC_CACHE_RETENTION
+        await self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=Filter(must=[
+                FieldCondition(key="created_at", range=Range(lt=time.time() - max_age))
+            ]))
+        )
+        logger.debug("Purged Qdrant semantic cache entries older than %ss", max_age)
+    
+    async def _ensure_collection(self, dimension: int) -> None:
+        """Create the collection with int8 scalar quantization if it does not exist."""
+        if self._collection_ready:
+            return
+        
+        async with self._collection_lock:
+            if self._collection_ready:
+                return
+            
+            if not await self.client.collection_exists(self.collection_name):
+                logger.info("Creating Qdrant collection %s", self.collection_name)
+                await self.client.create_collection(
+                    collection_name=self.collection_name,
+                    vectors_config=VectorParams(size=dimension, distance=Distance.COSINE),
+                    quantization_config=ScalarQuantization(
+                        scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True)
+                    )
+                )
+            self._collection_ready = True
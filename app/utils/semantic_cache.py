@@ -0,0 +1,248 @@
+import asyncio
+import os
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+from langchain_openai import OpenAIEmbeddings
+from app.utils.logging_utils import setup_logger
+
+# Set up logger
+logger = setup_logger("semantic_cache")
+
+# Load environment variables
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Backend used for the semantic cache: "memory" (per-process FAISS) or "qdrant" (shared)
+SEMANTIC_CACHE_BACKEND = os.getenv("SEMANTIC_CACHE_BACKEND", "memory")
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+
+# Neighbours examined by a scoped in-memory lookup before giving up
+SCOPED_SEARCH_K = 16
+
+# Seconds that shared (Qdrant) entries of caches without a TTL are kept before being purged
+SEMANTIC_CACHE_RETENTION = float(os.getenv("SEMANTIC_CACHE_RETENTION", str(30 * 24 * 60 * 60)))
+
+class SemanticCache:
+    """In-memory semantic cache that returns stored results for similar prompts."""
+    
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        max_size: int = 1000,
+        embedding_model: str = "text-embedding-3-small",
+        ttl: Optional[float] = None
+    ):
+        """
+        Initialize the semantic cache.
+        
+        Args:
+            threshold: Minimum cosine similarity for a lookup to count as a hit
+            max_size: Maximum number of entries kept before evicting the least recently used
+            embedding_model: OpenAI embedding model used to embed cache keys
+            ttl: Seconds after which an entry is treated as stale, or None to keep entries forever
+        """
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        # Up to 2048 inputs fit in a single embeddings request
+        self.embeddings = OpenAIEmbeddings(
+            model=embedding_model,
+            openai_api_key=OPENAI_API_KEY,
+            chunk_size=2048
+        )
+        
+        # Vectors live in the FAISS index, (creation time, scope, payload) tuples in
+        # an LRU-ordered dict keyed by vector id
+        self._index: Optional[faiss.IndexIDMap] = None
+        self._entries: "OrderedDict[int, Tuple[float, Optional[str], Dict[str, Any]]]" = OrderedDict()
+        self._next_id = 0
+        
+        # Lookup counters reported by get_stats
+        self.hits = 0
+        self.misses = 0
+    
+    async def embed(self, text: str) -> np.ndarray:
+        """
+        Embed a cache key as a normalized vector.
+        
+        Args:
+            text: The text to embed
+            
+        Returns:
+            Unit-length embedding vector
+        """
+        vector = await self.embeddings.aembed_query(text)
+        return self._normalize(vector)
+    
+    async def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Embed several cache keys with a single embeddings request.
+        
+        Args:
+            texts: The texts to embed
+            
+        Returns:
+            Unit-length embedding vectors in the same order as the texts
+        """
+        vectors = await self.embeddings.aembed_documents(texts)
+        return [self._normalize(vector) for vector in vectors]
+    
+    async def lookup(self, vector: np.ndarray, scope: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find the cached value whose key is most similar to the given vector.
+        
+        Args:
+            vector: Normalized embedding of the cache key
+            scope: If given, only entries stored with exactly this scope can match
+            
+        Returns:
+            The cached value if its similarity is above the threshold, otherwise None
+        """
+        if self._index is None or not self._entries:
+            self.misses += 1
+            return None
+        
+        # Look past the nearest neighbour when entries from other scopes may be closer
+        k = 1 if scope is None else min(len(self._entries), SCOPED_SEARCH_K)
+        scores, ids = self._index.search(vector.reshape(1, -1), k)
+        for score, entry_id in zip(scores[0].tolist(), ids[0].tolist()):
+            if entry_id == -1 or score < self.threshold:
+                break
+            if scope is not None and self._entries[entry_id][1] != scope:
+                continue
+            
+            created_at, _, value = self._entries[entry_id]
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                logger.debug("Semantic cache entry %s expired", entry_id)
+                del self._entries[entry_id]
+                self._index.remove_ids(np.array([entry_id], dtype=np.int64))
+                break
+            
+            logger.debug("Semantic cache hit (score: %.3f)", score)
+            self.hits += 1
+            self._entries.move_to_end(entry_id)
+            return value
+        
+        logger.debug("Semantic cache miss (best score: %.3f)", float(scores[0][0]))
+        self.misses += 1
+        return None
+    
+    async def store(self, vector: np.ndarray, value: Dict[str, Any], scope: Optional[str] = None) -> None:
+        """
+        Store a value in the cache, evicting the least recently used entry if full.
+        
+        Args:
+            vector: Normalized embedding of the cache key
+            value: The value to cache
+            scope: Optional exact-match tag a later lookup must give to find this entry
+        """
+        if self._index is None:
+            self._index = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[0]))
+        
+        entry_id = self._next_id
+        self._next_id += 1
+        self._index.add_with_ids(vector.reshape(1, -1), np.array([entry_id], dtype=np.int64))
+        self._entries[entry_id] = (time.time(), scope, value)
+        
+        if len(self._entries) > self.max_size:
+            evicted_id, _ = self._entries.popitem(last=False)
+            self._index.remove_ids(np.array([evicted_id], dtype=np.int64))
+            logger.debug("Evicted semantic cache entry %s", evicted_id)
+    
+    async def purge_expired(self) -> None:
+        """Remove entries older than the TTL; the size limit bounds caches without one."""
+        if self.ttl is None or self._index is None:
+            return
+        
+        cutoff = time.time() - self.ttl
+        expired = [entry_id for entry_id, (created_at, _, _) in self._entries.items() if created_at < cutoff]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._index.remove_ids(np.array(expired, dtype=np.int64))
+        logger.debug("Purged %s expired semantic cache entries", len(expired))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Report how effective the cache has been.
+        
+        Returns:
+            Dictionary with hit and miss counts, the hit rate and the number of local entries
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries)
+        }
+    
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        """Normalize a vector so inner product equals cosine similarity."""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+# Caches created by create_semantic_cache, purged by cleanup_semantic_caches
+_caches: "weakref.WeakSet[SemanticCache]" = weakref.WeakSet()
+
+def create_semantic_cache(
+    collection_name: str,
+    model_name: Optional[str] = None,
+    temperature: Optional[float] = None,
+    threshold: float = 0.9,
+    ttl: Optional[float] = None
+) -> SemanticCache:
+    """
+    Create a semantic cache using the backend configured by SEMANTIC_CACHE_BACKEND.
+    
+    Args:
+        collection_name: Name of the shared collection, used by the Qdrant backend
+        model_name: LLM model whose outputs are cached, if any
+        temperature: LLM temperature whose outputs are cached, if any
+        threshold: Minimum cosine similarity for a lookup to count as a hit
+        ttl: Seconds after which an entry is treated as stale, or None to keep entries forever
+        
+    Returns:
+        A semantic cache instance
+    """
+    if SEMANTIC_CACHE_BACKEND == "qdrant":
+        # qdrant_client is slow to import, so only load it when the backend is used
+        from app.utils.qdrant_semantic_cache import QdrantSemanticCache
+        
+        logger.info("Using Qdrant semantic cache at %s", QDRANT_URL)
+        cache = QdrantSemanticCache(
+            collection_name=collection_name,
+            model_name=model_name,
+            temperature=temperature,
+            threshold=threshold,
+            ttl=ttl
+        )
+    else:
+        cache = SemanticCache(threshold=threshold, ttl=ttl)
+    
+    _caches.add(cache)
+    return cache
+
+async def cleanup_semantic_caches(interval: float = 24 * 60 * 60) -> None:
+    """
+    Purge expired entries from every semantic cache, once per interval, until cancelled.
+    
+    Args:
+        interval: Seconds between cleanups
+    """
+    while True:
+        for cache in list(_caches):
+            try:
+                await cache.purge_expired()
+            except Exception as e:
+                logger.warning("Semantic cache cleanup failed: %s", e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,25 @@
+import os
+import uvicorn
+
+def run_server() -> None:
+    """
+    Run the API with uvicorn, configured from the environment.
+    
+    ENV defaults to "dev", which runs a single auto-reloading worker. Any other
+    value runs WEB_CONCURRENCY workers (default: one per CPU core) without the
+    file watcher, using httptools and uvloop where it is installed.
+    """
+    port = int(os.getenv("PORT", 8000))
+    if os.getenv("ENV", "dev") == "dev":
+        # Auto-reload runs a single worker, which is fine for development
+        uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=True)
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host="0.0.0.0",
+            port=port,
+            workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+            # uvloop isn't available on Windows; "auto" uses it whenever it is installed
+            loop="auto",
+            http="httptools"
+        )
@@ -1,10 +1,27 @@
+import asyncio
+import hashlib
 import os
-from typing import List, Dict, Any
+import re
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+from urllib.parse import urlparse
 from dotenv import load_dotenv
-import requests
-from bs4 import BeautifulSoup
-from langchain.tools import Tool
-from tavily import TavilyClient
+import aiohttp
+import diskcache
+from cachetools import TTLCache
+from app.utils.logging_utils import setup_logger
+
+# requests, selectolax, bs4, langchain, tavily and the semantic cache are
+# imported on first use to keep startup and dev-server reloads fast
+if TYPE_CHECKING:
+    import requests
+    from bs4 import SoupStrainer
+    from langchain.tools import Tool
+
+# Set up logger
+logger = setup_logger("web_research")
 
 # Load environment variables
 load_dotenv()
@@ -12,38 +29,177 @@ load_dotenv()
 # Initialize Tavily client if API key is available
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 
+# Give up on a page if fetching it takes longer than this
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+# Upper bounds on concurrent page fetches, overall and to any single host
+MAX_CONCURRENT_FETCHES = 100
+MAX_FETCHES_PER_HOST = 6
+
+# Search results with at least this much content already hold the page's
+# main text, so their pages aren't fetched again
+RICH_SNIPPET_CHARS = 800
+
+# Hosts whose pages are behind logins or rendered by JavaScript, so fetching
+# them yields nothing beyond the search snippet
+_SKIP_HOSTS = frozenset({
+    "pinterest.com", "twitter.com", "x.com", "linkedin.com", "facebook.com", "instagram.com"
+})
+
+# Stop reading a page after this many bytes, far more than the text we keep
+MAX_PAGE_BYTES = 512 * 1024
+
+# Runs of spaces/tabs split a line into phrases; blank lines and the
+# whitespace around line breaks collapse to a single newline
+_WS_RE = re.compile(r"[ \t]{2,}|\r")
+_BLANK_RE = re.compile(r"\s*\n\s*")
+
+# Only build the tree for tags that carry the main text of a page,
+# skipping navigation, sidebars and footers
+_TEXT_TAGS = ["p", "h1", "h2", "h3", "h4", "li", "article", "main"]
+_text_strainer: Optional["SoupStrainer"] = None
+
+# Tags whose text is never part of the page content
+_NOISE_TAGS = ["script", "style", "noscript", "iframe", "svg", "nav", "footer", "header", "aside", "form"]
+
+# How long identical search queries are answered from the local cache, in seconds
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "600"))
+
+# How long researched topics are reused for similar topics, in seconds
+RESEARCH_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Searches and extracted pages are also cached on disk so they survive restarts
+WEB_CACHE_DIR = os.getenv("WEB_CACHE_DIR", ".cache/web")
+SEARCH_DISK_CACHE_TTL = 60 * 60
+PAGE_CACHE_TTL = 24 * 60 * 60
+# Stale pages are kept a while longer so they can be revalidated with a conditional GET
+PAGE_CACHE_RETENTION = 7 * 24 * 60 * 60
+_web_cache = diskcache.Cache(WEB_CACHE_DIR)
+
+# Identify the researcher to the sites it fetches
+REQUEST_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; CourseGenResearcher/1.0)"}
+
+def _is_skipped_host(url: str) -> bool:
+    """Return whether the URL points at a host not worth fetching."""
+    host = urlparse(url).netloc.lower().removeprefix("www.")
+    return any(host == skip or host.endswith("." + skip) for skip in _SKIP_HOSTS)
+
+def _web_cache_key(kind: str, value: str) -> str:
+    """Build the disk cache key for a search query or page URL."""
+    return hashlib.sha256(f"{kind}:{value}".encode()).hexdigest()
+
+async def cleanup_web_cache(interval: float = 24 * 60 * 60) -> None:
+    """
+    Remove expired entries from the disk cache, once per interval, until cancelled.
+    
+    Args:
+        interval: Seconds between cleanups
+    """
+    while True:
+        removed = await asyncio.to_thread(_web_cache.expire)
+        logger.debug("Removed %s expired web cache entries", removed)
+        await asyncio.sleep(interval)
+
+class _FetchLimits:
+    """Semaphores bounding concurrent page fetches on one event loop."""
+    
+    def __init__(self):
+        """Initialize the overall limit; per-host limits are created on demand."""
+        self.total = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+    
+    def for_host(self, url: str) -> asyncio.Semaphore:
+        """Return the semaphore limiting fetches to the URL's host."""
+        host = urlparse(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(MAX_FETCHES_PER_HOST)
+        return self._hosts[host]
+
 class WebResearcher:
     """Class for conducting web research."""
     
     def __init__(self):
         if TAVILY_API_KEY:
+            from tavily import TavilyClient
             self.tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
         else:
             self.tavily_client = None
-            print("Warning: TAVILY_API_KEY not found. Web research functionality will be limited.")
+            logger.warning("TAVILY_API_KEY not found. Web research functionality will be limited.")
+        
+        # Reuse research for semantically similar topics for up to a week
+        from app.utils.semantic_cache import create_semantic_cache
+        self.semantic_cache = create_semantic_cache(
+            collection_name="course_gen_web_research",
+            threshold=0.92,
+            ttl=RESEARCH_CACHE_TTL
+        )
+        
+        # Recent search results keyed by normalized query; searches run in worker
+        # threads, so the cache is guarded by a lock
+        self._search_cache: TTLCache = TTLCache(maxsize=512, ttl=SEARCH_CACHE_TTL)
+        self._search_cache_lock = threading.Lock()
+        
+        # Pooled keep-alive session for synchronous fetches, created on first use
+        self._session: Optional["requests.Session"] = None
+        
+        # One aiohttp session and set of fetch limits per event loop, so page
+        # fetches reuse connections
+        self._sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._fetch_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _FetchLimits]" = (
+            weakref.WeakKeyDictionary()
+        )
     
-    def search_web(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+    def search_web(self, query: str, max_results: int = 5, bypass: bool = False) -> List[Dict[str, Any]]:
         """
         Search the web for information related to the query.
         
         Args:
             query: The search query
             max_results: Maximum number of results to return
+            bypass: Skip the local search cache for this query
             
         Returns:
             List of dictionaries containing search results
         """
         if self.tavily_client:
+            key = (query.strip().lower(), max_results)
+            disk_key = _web_cache_key("search", f"{key[0]}:{max_results}")
+            if not bypass:
+                with self._search_cache_lock:
+                    cached = self._search_cache.get(key)
+                if cached is not None:
+                    return cached
+                
+                cached = _web_cache.get(disk_key)
+                if cached is not None:
+                    logger.debug("cache hit query=%s", query)
+                    with self._search_cache_lock:
+                        self._search_cache[key] = cached
+                    return cached
+            
             try:
                 # Use Tavily for web search
                 search_results = self.tavily_client.search(
                     query=query,
                     search_depth="advanced",
-                    max_results=max_results
+                    max_results=max_results,
+                    include_raw_content=True,
+                    use_cache=True
                 )
-                return search_results.get("results", [])
+                results = search_results.get("results", [])
+                # Raw page text can be huge; keep no more than we would extract ourselves
+                for result in results:
+                    if result.get("raw_content"):
+                        result["raw_content"] = result["raw_content"][:10000]
+                if not bypass:
+                    with self._search_cache_lock:
+                        self._search_cache[key] = results
+                    _web_cache.set(disk_key, results, expire=SEARCH_DISK_CACHE_TTL)
+                return results
             except Exception as e:
-                print(f"Error during Tavily search: {str(e)}")
+                logger.error("Error during Tavily search: %s", e)
                 return self._fallback_search(query, max_results)
         else:
             return self._fallback_search(query, max_results)
@@ -80,42 +236,236 @@ class WebResearcher:
         Returns:
             Extracted text content
         """
+        page_key = _web_cache_key("url", url)
+        entry = self._get_page_entry(page_key)
+        if entry is not None and time.time() - entry["ts"] < PAGE_CACHE_TTL:
+            logger.debug("cache hit url=%s", url)
+            return entry["body_text"]
+        
         try:
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Remove script and style elements
-                for script in soup(["script", "style"]):
-                    script.extract()
-                
-                # Get text
-                text = soup.get_text(separator="\n")
-                
-                # Break into lines and remove leading and trailing space on each
-                lines = (line.strip() for line in text.splitlines())
-                # Break multi-headlines into a line each
-                chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                # Drop blank lines
-                text = '\n'.join(chunk for chunk in chunks if chunk)
+            with self._get_http_session().get(
+                url, timeout=10, stream=True, headers=self._conditional_headers(entry)
+            ) as response:
+                if response.status_code == 304 and entry is not None:
+                    logger.debug("cache revalidated url=%s", url)
+                    return self._touch_page_entry(page_key, entry)
+                if response.status_code != 200:
+                    if entry is not None:
+                        return entry["body_text"]
+                    return f"Failed to retrieve content. Status code: {response.status_code}"
                 
-                return text[:10000]  # Limit text length
-            else:
-                return f"Failed to retrieve content. Status code: {response.status_code}"
+                # Read at most MAX_PAGE_BYTES so huge pages don't cost memory and parse time
+                body = bytearray()
+                for chunk in response.iter_content(chunk_size=65536):
+                    body.extend(chunk)
+                    if len(body) >= MAX_PAGE_BYTES:
+                        break
+            
+            return self._html_to_cached_text(page_key, bytes(body), response.headers)
+        except Exception as e:
+            # Serve the stale copy rather than nothing
+            if entry is not None:
+                return entry["body_text"]
+            return f"Error extracting content: {str(e)}"
+    
+    async def _extract_content_async(self, session: aiohttp.ClientSession, url: str) -> str:
+        """
+        Extract content from a webpage without blocking the event loop.
+        
+        Args:
+            session: The aiohttp session to fetch the page with
+            url: URL of the webpage
+            
+        Returns:
+            Extracted text content
+        """
+        page_key = _web_cache_key("url", url)
+        entry = await asyncio.to_thread(self._get_page_entry, page_key)
+        if entry is not None and time.time() - entry["ts"] < PAGE_CACHE_TTL:
+            logger.debug("cache hit url=%s", url)
+            return entry["body_text"]
+        
+        limits = self._get_fetch_limits()
+        try:
+            # Bound concurrency overall and per host so no single site gets flooded
+            async with limits.total, limits.for_host(url):
+                async with session.get(url, headers=self._conditional_headers(entry)) as response:
+                    if response.status == 304 and entry is not None:
+                        logger.debug("cache revalidated url=%s", url)
+                        return await asyncio.to_thread(self._touch_page_entry, page_key, entry)
+                    if response.status != 200:
+                        if entry is not None:
+                            return entry["body_text"]
+                        return f"Failed to retrieve content. Status code: {response.status}"
+                    # Read at most MAX_PAGE_BYTES so huge pages don't cost memory and parse time
+                    body = bytearray()
+                    async for chunk in response.content.iter_chunked(65536):
+                        body.extend(chunk)
+                        if len(body) >= MAX_PAGE_BYTES:
+                            break
+                    headers = response.headers
+            
+            # Parsing is CPU-bound, so keep it off the event loop
+            return await asyncio.to_thread(self._html_to_cached_text, page_key, bytes(body), headers)
         except Exception as e:
+            # Serve the stale copy rather than nothing
+            if entry is not None:
+                return entry["body_text"]
             return f"Error extracting content: {str(e)}"
     
-    def research_topic(self, topic: str) -> Dict[str, Any]:
+    def _get_page_entry(self, page_key: str) -> Optional[Dict[str, Any]]:
+        """Return the disk cache entry for a page, fresh or stale, if there is one."""
+        entry = _web_cache.get(page_key)
+        return entry if isinstance(entry, dict) else None
+    
+    def _conditional_headers(self, entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """Build the headers that let the server answer 304 if a cached page is unchanged."""
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+    
+    def _touch_page_entry(self, page_key: str, entry: Dict[str, Any]) -> str:
+        """Mark a revalidated page as fresh again and return its text."""
+        _web_cache.set(page_key, dict(entry, ts=time.time()), expire=PAGE_CACHE_RETENTION)
+        return entry["body_text"]
+    
+    def _html_to_cached_text(self, page_key: str, html: bytes, headers: Any) -> str:
+        """Convert a fetched page to text and store it with its validators in the disk cache."""
+        text = self._html_to_text(html)
+        _web_cache.set(page_key, {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "body_text": text,
+            "ts": time.time()
+        }, expire=PAGE_CACHE_RETENTION)
+        return text
+    
+    def _html_to_text(self, html: bytes) -> str:
+        """
+        Convert the raw HTML of a page to plain text.
+        
+        Args:
+            html: The raw page body
+            
+        Returns:
+            The page text, limited to 10000 characters
+        """
+        try:
+            text = self._lexbor_text(html)
+        except Exception as e:
+            logger.debug("selectolax parse failed, falling back to BeautifulSoup: %s", e)
+            text = self._soup_text(html)
+        
+        # Break multi-headlines into a line each, then trim lines and drop blank ones
+        text = _WS_RE.sub("\n", text)
+        text = _BLANK_RE.sub("\n", text).strip()
+        
+        return text[:10000]  # Limit text length
+    
+    def _lexbor_text(self, html: bytes) -> str:
+        """Extract the visible text of a page with selectolax's lexbor parser."""
+        from selectolax.lexbor import LexborHTMLParser
+        
+        tree = LexborHTMLParser(html)
+        # Remove scripts, styles and page chrome
+        tree.strip_tags(_NOISE_TAGS)
+        return tree.body.text(separator="\n") if tree.body else ""
+    
+    def _soup_text(self, html: bytes) -> str:
+        """Extract the visible text of a page with BeautifulSoup, for pages selectolax can't parse."""
+        # Parse the raw bytes with lxml so it detects the encoding itself,
+        # keeping only text-bearing tags; fall back to the whole document for
+        # pages that keep their text outside of them
+        from bs4 import BeautifulSoup, SoupStrainer
+        
+        global _text_strainer
+        if _text_strainer is None:
+            _text_strainer = SoupStrainer(_TEXT_TAGS)
+        soup = BeautifulSoup(html, 'lxml', parse_only=_text_strainer)
+        if not soup.contents:
+            soup = BeautifulSoup(html, 'lxml')
+        
+        # Remove scripts, styles and page chrome
+        for tag in soup.find_all(_NOISE_TAGS):
+            tag.decompose()
+        
+        return soup.get_text(separator="\n")
+    
+    def _get_http_session(self) -> "requests.Session":
+        """Return the pooled requests session, creating it on first use."""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            
+            session = requests.Session()
+            session.headers.update(REQUEST_HEADERS)
+            adapter = HTTPAdapter(
+                pool_connections=10,
+                pool_maxsize=50,
+                max_retries=Retry(total=2, backoff_factor=0.2)
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the aiohttp session for the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=MAX_CONCURRENT_FETCHES,
+                limit_per_host=MAX_FETCHES_PER_HOST,
+                ttl_dns_cache=300,
+                enable_cleanup_closed=True
+            )
+            session = aiohttp.ClientSession(connector=connector, timeout=FETCH_TIMEOUT, headers=REQUEST_HEADERS)
+            self._sessions[loop] = session
+        return session
+    
+    def _get_fetch_limits(self) -> _FetchLimits:
+        """Return the fetch limits for the running event loop, creating them on first use."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._fetch_limits:
+            self._fetch_limits[loop] = _FetchLimits()
+        return self._fetch_limits[loop]
+    
+    async def close(self) -> None:
+        """Close the aiohttp session for the running event loop."""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+    
+    async def research_topic(self, topic: str, no_cache: bool = False) -> Dict[str, Any]:
         """
         Conduct research on a specific topic.
         
         Args:
             topic: The topic to research
+            no_cache: Skip the semantic research cache for this topic
             
         Returns:
             Dictionary containing research results
         """
-        results = self.search_web(topic)
+        # Return cached research for a semantically similar topic
+        key_vector = None
+        if not no_cache:
+            try:
+                key_vector = await self.semantic_cache.embed(" ".join(topic.lower().split()))
+                cached = await self.semantic_cache.lookup(key_vector)
+                if cached is not None:
+                    logger.info("Using cached web research for topic: %s", topic)
+                    return dict(cached, topic=topic)
+            except Exception as e:
+                logger.warning("Semantic cache lookup failed: %s", e)
+        
+        results = await asyncio.to_thread(self.search_web, topic)
         research_data = {
             "topic": topic,
             "sources": [],
@@ -128,34 +478,95 @@ class WebResearcher:
                 "url": result.get("url", ""),
                 "snippet": result.get("content", "")
             }
-            
-            # If we have access to the full content, extract it
-            if source["url"]:
-                try:
-                    full_content = self.extract_content(source["url"])
-                    if len(full_content) > 500:  # Only use if we got meaningful content
-                        source["full_content"] = full_content
-                except Exception as e:
-                    source["extraction_error"] = str(e)
-            
+            # Prefer the full page text Tavily extracted on its side
+            raw_content = result.get("raw_content") or ""
+            if len(raw_content) > 500:
+                source["full_content"] = raw_content
             research_data["sources"].append(source)
         
+        # If we have access to the full content, fetch every source concurrently;
+        # the task group doesn't return until every fetch has finished or been cancelled
+        session = self._get_session()
+        async with asyncio.TaskGroup() as tg:
+            for source in research_data["sources"]:
+                if "full_content" in source:
+                    continue
+                if len(source["snippet"]) >= RICH_SNIPPET_CHARS:
+                    source["full_content"] = source["snippet"]
+                elif source["url"] and not _is_skipped_host(source["url"]):
+                    tg.create_task(self._add_full_content(session, source))
+        
+        # Fallback results are placeholders, so only cache real research
+        if key_vector is not None and self.tavily_client:
+            try:
+                await self.semantic_cache.store(key_vector, research_data)
+            except Exception as e:
+                logger.warning("Semantic cache store failed: %s", e)
+        
         return research_data
+    
+    async def _add_full_content(self, session: aiohttp.ClientSession, source: Dict[str, Any]) -> None:
+        """Fetch a source's page and attach its text, recording the error instead of raising."""
+        try:
+            full_content = await self._extract_content_async(session, source["url"])
+        except Exception as e:
+            source["extraction_error"] = str(e)
+            return
+        
+        if len(full_content) > 500:  # Only use if we got meaningful content
+            source["full_content"] = full_content
+    
+    def research_topic_sync(self, topic: str) -> Dict[str, Any]:
+        """
+        Conduct research on a specific topic from synchronous code.
+        
+        Args:
+            topic: The topic to research
+            
+        Returns:
+            Dictionary containing research results
+        """
+        async def run() -> Dict[str, Any]:
+            try:
+                return await self.research_topic(topic)
+            finally:
+                # The loop is discarded afterwards, so don't leave its session open
+                await self.close()
+        
+        return asyncio.run(run())
+
+# Researcher shared by every caller, so its connection pools and caches persist
+_researcher: Optional[WebResearcher] = None
+
+# Tool returned by get_web_research_tool, created on first use
+_web_research_tool: Optional["Tool"] = None
+
+def get_web_researcher() -> WebResearcher:
+    """Return the process-wide web researcher, creating it on first use."""
+    global _researcher
+    if _researcher is None:
+        _researcher = WebResearcher()
+    return _researcher
 
 # Create a tool for LangChain integration
 def get_web_research_tool():
     """
-    Create a LangChain tool for web research.
+    Return the LangChain tool for web research, creating it on first use.
     
     Returns:
         A LangChain Tool instance
     """
-    researcher = WebResearcher()
-    
-    web_research_tool = Tool(
-        name="web_research",
-        description="Search the web for information on a specific topic.",
-        func=researcher.research_topic
-    )
+    global _web_research_tool
+    if _web_research_tool is None:
+        from langchain.tools import Tool
+        
+        researcher = get_web_researcher()
+        
+        _web_research_tool = Tool(
+            name="web_research",
+            description="Search the web for information on a specific topic.",
+            func=researcher.research_topic_sync,
+            coroutine=researcher.research_topic
+        )
     
-    return web_research_tool 
\ No newline at end of file
+    return _web_research_tool 
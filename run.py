@@ -1,13 +1,8 @@
-import uvicorn
-import os
 from dotenv import load_dotenv
+from app.utils.server import run_server
 
 # Load environment variables
 load_dotenv()
 
 if __name__ == "__main__":
-    # Get port from environment variables or use default
-    port = int(os.getenv("PORT", 8000))
-    
-    # Run the FastAPI application
-    uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=True) 
\ No newline at end of file
+    run_server()